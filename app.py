@@ -1,97 +1,1422 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from github import Github
+from github import Github, GithubRetry
 import requests
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
 import logging
 import json
 import time
+import hashlib
+import random
+import fnmatch
+import re
+import tarfile
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 
-# Configure detailed logging
+# Load environment variables
+load_dotenv()
+
+# Configure logging; set LOG_LEVEL=DEBUG for detailed output
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Bump whenever the analysis prompt changes so cached results are not reused
+PROMPT_VERSION = 1
+
+class Metrics:
+    """Per-stage timing histograms and counters exposed at /metrics.
+
+    Each process records its own in memory and publishes them to a shared SQLite
+    file, so /metrics reports totals across every worker process.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+    def __init__(self, path=None, busy_timeout=5):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        # Opened on first publish, so each forked worker gets its own connection and process ID
+        self._db = None
+        self._pid = None
+        self._process = None
+        self._db_lock = threading.Lock()
+        self._publisher = None
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(
+                stage, {"count": 0, "sum": 0.0, "buckets": [0] * len(self.BUCKETS)}
+            )
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator recording the duration of every call under stage"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """This process's metrics"""
+        return self._format(self._export())
+
+    def shared_snapshot(self):
+        """Metrics summed over every process that has published to the shared file"""
+        if not self.path:
+            return self.snapshot()
+        self.publish()
+        try:
+            with self._db_lock:
+                rows = self._connect().execute("SELECT state FROM metrics").fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read shared metrics from {self.path}: {str(e)}")
+            return self.snapshot()
+
+        merged = {"histograms": {}, "counters": {}}
+        for (state,) in rows:
+            state = json.loads(state)
+            for stage, histogram in state["histograms"].items():
+                total = merged["histograms"].setdefault(
+                    stage, {"count": 0, "sum": 0.0, "buckets": [0] * len(self.BUCKETS)}
+                )
+                total["count"] += histogram["count"]
+                total["sum"] += histogram["sum"]
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+            for counter, value in state["counters"].items():
+                merged["counters"][counter] = merged["counters"].get(counter, 0) + value
+        return self._format(merged)
+
+    def publish(self):
+        """Store this process's metrics in the shared file"""
+        if not self.path:
+            return
+        state = json.dumps(self._export())
+        try:
+            with self._db_lock:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO metrics (process, state, updated) VALUES (?, ?, ?)",
+                    (self._process, state, time.time())
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish metrics to {self.path}: {str(e)}")
+
+    def start_publishing(self, interval):
+        """Publish every interval seconds from a background thread"""
+        if self._publisher is not None and self._publisher[0] == os.getpid():
+            return
+
+        def publish_forever():
+            while True:
+                time.sleep(interval)
+                self.publish()
+
+        thread = threading.Thread(target=publish_forever, name="metrics-publisher", daemon=True)
+        self._publisher = (os.getpid(), thread)
+        thread.start()
+
+    def _connect(self):
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metrics (process TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._pid = os.getpid()
+            self._process = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        return self._db
+
+    def _export(self):
+        with self._lock:
+            return {
+                "histograms": {
+                    stage: {"count": h["count"], "sum": h["sum"], "buckets": list(h["buckets"])}
+                    for stage, h in self._histograms.items()
+                },
+                "counters": dict(self._counters)
+            }
+
+    def _format(self, state):
+        histograms = {}
+        for stage, histogram in state["histograms"].items():
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                cumulative += count
+                buckets["+Inf" if bound == float('inf') else str(bound)] = cumulative
+            histograms[stage] = {
+                "count": histogram["count"],
+                "sum": round(histogram["sum"], 6),
+                "mean": round(histogram["sum"] / histogram["count"], 6),
+                "buckets": buckets
+            }
+        return {"stages": histograms, "counters": state["counters"]}
+
+metrics = Metrics(os.getenv('METRICS_PATH', 'metrics.db'))
+
+class AnalysisCache:
+    """Two-tier cache for code analyses: in-memory LRU backed by SQLite.
+
+    The cache is best-effort: SQLite errors (e.g. "database is locked" when
+    several processes share the file) are logged and counted, never raised.
+    """
+
+    def __init__(self, path, memory_items=256, max_entries=10000, max_age=30 * 24 * 3600, busy_timeout=5):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._writes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        try:
+            # WAL lets readers proceed while another process writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "key TEXT PRIMARY KEY, analysis TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_error("initializing", e)
+        self.evict()
+
+    @staticmethod
+    def make_key(content_id, language, model):
+        return f"{content_id}:{language}:{model}:v{PROMPT_VERSION}"
+
+    def get(self, key):
+        with self._lock:
+            now = time.time()
+            if key in self._memory:
+                analysis, created = self._memory[key]
+                if now - created <= self.max_age:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.increment("cache_hits")
+                    return analysis
+                del self._memory[key]
+
+            try:
+                row = self._db.execute(
+                    "SELECT analysis, created FROM analyses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.max_age:
+                    self._db.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+            except sqlite3.Error as e:
+                self._db_error("reading", e)
+                row = None
+
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                metrics.increment("cache_misses")
+                return None
+
+            self._remember(key, row[0], row[1])
+            self.hits += 1
+            metrics.increment("cache_hits")
+            return row[0]
+
+    def set(self, key, analysis):
+        with self._lock:
+            now = time.time()
+            self._remember(key, analysis, now)
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analyses (key, analysis, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, analysis, now, now)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db_error("writing", e)
+                return
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def evict(self):
+        """Drop expired entries and trim the disk tier to max_entries"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        try:
+            self._db.execute("DELETE FROM analyses WHERE created < ?", (time.time() - self.max_age,))
+            self._db.execute(
+                "DELETE FROM analyses WHERE key NOT IN "
+                "(SELECT key FROM analyses ORDER BY accessed DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_error("evicting", e)
+
+    def stats(self):
+        with self._lock:
+            try:
+                entries = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            except sqlite3.Error as e:
+                self._db_error("counting", e)
+                entries = None
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "memory_entries": len(self._memory),
+                "disk_entries": entries
+            }
+
+    def _remember(self, key, analysis, created):
+        self._memory[key] = (analysis, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _db_error(self, action, error):
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+        self.errors += 1
+        metrics.increment("cache_errors")
+        logger.warning(f"Analysis cache error while {action} {self.path}: {str(error)}")
+
+class TokenBucket:
+    """Thread-safe token bucket limiting requests per second across workers"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+class HTTPClient:
+    """Pooled HTTP client with timeouts, rate limiting and retry with backoff"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url, headers=None, pool_size=10, connect_timeout=5, read_timeout=120,
+                 max_retries=4, backoff=0.5, max_backoff=60, max_rate_limit_wait=300, rate=0, burst=None,
+                 pool_block=False):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.limiter = TokenBucket(rate, burst)
+        self.retries = 0
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        # With pool_block, callers beyond pool_size wait for a free connection
+        # instead of opening one that is discarded afterwards
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        """Send a request, retrying 429/5xx, rate-limited 403 responses and connection errors"""
+        if path.startswith(('http://', 'https://')):
+            url = path
+        else:
+            url = f"{self.base_url}/{path.lstrip('/')}"
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if not self.is_retryable(response) or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_delay(response, attempt)
+                if delay is None:
+                    logger.warning(f"{method} {url} is rate limited for longer than {self.max_rate_limit_wait}s, giving up")
+                    return response
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            self.retries += 1
+            metrics.increment("http_retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def is_retryable(self, response):
+        # GitHub reports an exhausted rate limit as 403 with X-RateLimit-Remaining: 0
+        if response.status_code == 403:
+            return response.headers.get('X-RateLimit-Remaining') == '0'
+        return response.status_code in self.RETRY_STATUSES
+
+    def _backoff_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying, or None if the server asks for more than max_rate_limit_wait.
+
+        Retry-After and X-RateLimit-Reset are honored in full rather than capped,
+        so retries are not spent while the limit is still in force.
+        """
+        delay = self._requested_delay(response)
+        if delay is None:
+            return self._backoff_delay(attempt)
+        return delay if delay <= self.max_rate_limit_wait else None
+
+    def _requested_delay(self, response):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        reset = response.headers.get('X-RateLimit-Reset')
+        if reset and (response.status_code == 429 or response.headers.get('X-RateLimit-Remaining') == '0'):
+            try:
+                reset = float(reset)
+                # GitHub sends an epoch timestamp; some APIs send seconds until reset
+                return max(0.0, reset - time.time() if reset > 1e9 else reset)
+            except ValueError:
+                pass
+        return None
+
+class MeteredGithubRetry(GithubRetry):
+    """GithubRetry that counts its retries, which bypass HTTPClient, in the metrics"""
+
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)
+        metrics.increment("http_retries")
+        metrics.increment("github_retries")
+        return retry
+
+class RepoFile:
+    """A repository file fetched in bulk, mirroring the ContentFile attributes we use"""
+
+    type = "file"
+
+    def __init__(self, path, sha, decoded_content):
+        self.path = path
+        self.sha = sha
+        self.decoded_content = decoded_content
+        self.size = len(decoded_content)
+
+class RepositoryFetcher:
+    """List a repository with one Git Trees call and pull blobs from one streamed tarball"""
+
+    VENDORED_DIRS = {
+        'node_modules', 'vendor', 'vendors', 'third_party', 'bower_components',
+        'dist', 'build', '.git', '__pycache__', '.venv', 'venv', 'site-packages'
+    }
+    BINARY_EXTENSIONS = {
+        'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico', 'webp', 'pdf', 'zip', 'gz', 'tgz',
+        'bz2', 'xz', '7z', 'rar', 'jar', 'war', 'class', 'exe', 'dll', 'so', 'dylib',
+        'o', 'a', 'pyc', 'whl', 'woff', 'woff2', 'ttf', 'otf', 'eot', 'mp3', 'mp4',
+        'wav', 'ogg', 'mov', 'avi', 'db', 'sqlite', 'bin', 'lock'
+    }
+
+    SYMLINK_MODE = "120000"
+
+    def __init__(self, http, include=None, exclude=None, max_file_size=200_000, max_skipped=100_000):
+        self.http = http
+        self.include = include or []
+        self.exclude = exclude or []
+        self.max_file_size = max_file_size
+        self.max_skipped = max_skipped
+        # Blob SHAs whose content turned out to be binary, so later trees don't select them again
+        self._skipped = OrderedDict()
+        self._lock = threading.Lock()
+
+    @metrics.timed("fetch")
+    def list_tree(self, repo, ref):
+        """Map each analyzable path at ref to its blob SHA with one recursive Git Trees call"""
+        tree = repo.get_git_tree(ref, recursive=True)
+        with self._lock:
+            wanted = {
+                element.path: element.sha
+                for element in tree.tree
+                if element.type == "blob" and element.mode != self.SYMLINK_MODE
+                and element.sha not in self._skipped and self.is_wanted(element.path, element.size)
+            }
+        truncated = tree.raw_data.get('truncated', False)
+        if truncated:
+            logger.warning(f"Git tree for {repo.full_name} is truncated, selecting files from the tarball")
+        return wanted, truncated
+
+    @metrics.timed("fetch")
+    def download(self, repo, ref, wanted, truncated=False):
+        """Download the wanted blobs (or every analyzable file if truncated) from the tarball.
+
+        Wanted blobs that turn out to be binary or not regular files are removed from wanted.
+        """
+        if not wanted and not truncated:
+            return []
+
+        files = self._read_tarball(repo.get_archive_link("tarball", ref), wanted, truncated)
+        logger.info(f"Fetched {len(files)} files from {repo.full_name}@{ref}")
+        return sorted(files, key=lambda f: f.path)
+
+    def is_wanted(self, path, size=None):
+        """Apply size, vendored-directory, binary-extension and glob filters"""
+        if size is not None and size > self.max_file_size:
+            return False
+        parts = path.split('/')
+        if any(part in self.VENDORED_DIRS for part in parts[:-1]):
+            return False
+        if '.' in parts[-1] and parts[-1].rsplit('.', 1)[-1].lower() in self.BINARY_EXTENSIONS:
+            return False
+        if self.include and not any(fnmatch.fnmatch(path, pattern) for pattern in self.include):
+            return False
+        return not any(fnmatch.fnmatch(path, pattern) for pattern in self.exclude)
+
+    def _read_tarball(self, url, wanted, select_all):
+        files = []
+        response = self.http.get(url, stream=True)
+        response.raise_for_status()
+        try:
+            # Stream-decompress the archive, keeping only the selected blobs in memory
+            with tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+                for member in archive:
+                    # Archive entries are prefixed with "<owner>-<repo>-<sha>/"
+                    path = member.name.split('/', 1)[-1]
+                    if not member.isfile():
+                        wanted.pop(path, None)
+                        continue
+                    if path not in wanted and not (select_all and self.is_wanted(path, member.size)):
+                        continue
+                    data = archive.extractfile(member).read()
+                    if b'\0' in data[:8192]:
+                        self._skip(wanted.pop(path, None) or git_blob_sha(data))
+                        continue
+                    files.append(RepoFile(path, wanted.get(path) or git_blob_sha(data), data))
+        finally:
+            response.close()
+        return files
+
+    def _skip(self, blob_sha):
+        with self._lock:
+            self._skipped[blob_sha] = True
+            while len(self._skipped) > self.max_skipped:
+                self._skipped.popitem(last=False)
+
+class RepositoryIndex:
+    """Persistent per-repository record of the last analyzed commit and file analyses.
+
+    Like AnalysisCache, the index is best-effort: SQLite errors are logged and
+    counted, a failed load reads as an empty index and a failed save is skipped.
+    """
+
+    def __init__(self, path, busy_timeout=5):
+        self.path = path
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        try:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS repositories ("
+                "name TEXT PRIMARY KEY, commit_sha TEXT, updated REAL NOT NULL, "
+                "complete INTEGER NOT NULL DEFAULT 0, analysis_version TEXT)"
+            )
+            # Indexes created before completeness and versions were tracked
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(repositories)")}
+            if 'complete' not in columns:
+                self._db.execute("ALTER TABLE repositories ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+            if 'analysis_version' not in columns:
+                self._db.execute("ALTER TABLE repositories ADD COLUMN analysis_version TEXT")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "repo TEXT NOT NULL, path TEXT NOT NULL, sha TEXT NOT NULL, analysis TEXT NOT NULL, "
+                "PRIMARY KEY (repo, path))"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            self._db_error("initializing", e)
+
+    def load(self, repo_name):
+        """Return the stored commit, completeness, analysis version and {path: (blob_sha, file_analysis)}"""
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT commit_sha, complete, analysis_version FROM repositories WHERE name = ?", (repo_name,)
+                ).fetchone()
+                rows = self._db.execute(
+                    "SELECT path, sha, analysis FROM files WHERE repo = ?", (repo_name,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                self._db_error(f"loading {repo_name} from", e)
+                row, rows = None, []
+        commit_sha, complete, version = row if row else (None, False, None)
+        return {
+            "commit": commit_sha,
+            "complete": bool(complete),
+            "version": version,
+            "files": {path: (sha, json.loads(analysis)) for path, sha, analysis in rows}
+        }
+
+    def save(self, repo_name, commit_sha, complete, version, files):
+        """Replace the stored state of a repository; paths not in files are dropped"""
+        with self._lock:
+            try:
+                self._db.execute("DELETE FROM files WHERE repo = ?", (repo_name,))
+                self._db.executemany(
+                    "INSERT INTO files (repo, path, sha, analysis) VALUES (?, ?, ?, ?)",
+                    [(repo_name, path, sha, json.dumps(analysis)) for path, (sha, analysis) in files.items()]
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO repositories (name, commit_sha, updated, complete, analysis_version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (repo_name, commit_sha, time.time(), int(complete), version)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db_error(f"saving {repo_name} to", e)
+
+    def _db_error(self, action, error):
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+        self.errors += 1
+        metrics.increment("index_errors")
+        logger.warning(f"Repository index error while {action} {self.path}: {str(error)}")
+
+class Job:
+    """Handle on a stored job; runners report progress and partial results through it"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+
+    @property
+    def status(self):
+        return self.queue._status(self.id)
+
+    def add_event(self, event):
+        self.queue._add_event(self.id, event)
+
+    def set_total(self, total):
+        self.queue._set_total(self.id, total)
+
+    def to_dict(self, since=0):
+        """Job status plus the events from offset since onwards, or None if the job expired"""
+        return self.queue._job_dict(self.id, since)
+
+class JobQueue:
+    """Job queue stored in SQLite, so every worker process can accept, run and report on jobs.
+
+    Users are served round-robin: the next job comes from the user served least
+    recently. A job whose key matches a queued or running job is deduplicated onto
+    it. Running jobs hold a lease that their process renews; if the process dies,
+    the job is failed once the lease lapses, which frees its key.
+    """
+
+    def __init__(self, path, runners, workers=2, ttl=3600, lease=60, poll_interval=0.5, busy_timeout=5):
+        self.path = path
+        self.runners = runners
+        self.workers = workers
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        # The database is opened on first use, so each forked worker gets its own connection
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._threads_lock = threading.Lock()
+        self._running = set()
+
+    def submit(self, key, user, description, kind, payload):
+        """Queue a job for runners[kind](job, payload), or return the live job with the same key.
+
+        Returns (job, deduplicated).
+        """
+        now = time.time()
+        with self._transaction() as db:
+            self._expire(db, now)
+            row = db.execute(
+                "SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running') LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                db.execute(
+                    "INSERT INTO jobs (id, key, user, description, kind, payload, status, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                    (job_id, key, user, description, kind, json.dumps(payload), now)
+                )
+        if row is not None:
+            logger.info(f"Deduplicated job for {key} onto {row[0]}")
+            metrics.increment("jobs_deduplicated")
+            return Job(self, row[0]), True
+
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return Job(self, job_id), False
+
+    def get(self, job_id):
+        with self._transaction(immediate=False) as db:
+            row = db.execute("SELECT id FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(self, job_id) if row else None
+
+    def start(self):
+        """Start this process's job workers and lease heartbeat"""
+        with self._threads_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                self._threads.append(threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True))
+            self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    @contextmanager
+    def _transaction(self, immediate=True):
+        with self._lock:
+            db = self._connect()
+            # IMMEDIATE takes the write lock up front, so claims and dedup checks are atomic across processes
+            db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                raise
+
+    def _connect(self):
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, key TEXT NOT NULL, user TEXT NOT NULL, description TEXT NOT NULL, "
+                "kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL, "
+                "total INTEGER, completed INTEGER NOT NULL DEFAULT 0, events INTEGER NOT NULL DEFAULT 0, error TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS job_users (user TEXT PRIMARY KEY, served REAL NOT NULL)")
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def _claim(self):
+        """Mark the next job running, taking it from the user served least recently"""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT jobs.id, jobs.user, jobs.kind, jobs.payload FROM jobs "
+                "LEFT JOIN job_users ON job_users.user = jobs.user "
+                "WHERE jobs.status = 'queued' "
+                "ORDER BY COALESCE(job_users.served, 0), jobs.created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', started = ?, heartbeat = ? WHERE id = ?", (now, now, row[0]))
+            db.execute("INSERT OR REPLACE INTO job_users (user, served) VALUES (?, ?)", (row[1], now))
+        return Job(self, row[0]), row[2], json.loads(row[3])
+
+    def _work(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Could not claim a job from {self.path}: {str(e)}")
+                claimed = None
+            if claimed is None:
+                # Other processes queue jobs too, so poll as well as waiting for local submissions
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            job, kind, payload = claimed
+            self._running.add(job.id)
+            status, error = "done", None
+            try:
+                self.runners[kind](job, payload)
+            except Exception as e:
+                logger.error(f"Job {job.id} ({kind}) failed: {str(e)}")
+                status, error = "failed", str(e)
+            finally:
+                self._running.discard(job.id)
+            try:
+                with self._transaction() as db:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                        (status, error, time.time(), job.id)
+                    )
+            except sqlite3.Error as e:
+                # The lease lapses and another process marks the job failed
+                logger.error(f"Could not record the result of job {job.id}: {str(e)}")
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.lease / 3)
+            now = time.time()
+            try:
+                with self._transaction() as db:
+                    db.executemany(
+                        "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                        [(now, job_id) for job_id in list(self._running)]
+                    )
+                    self._expire(db, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew job leases in {self.path}: {str(e)}")
+
+    def _expire(self, db, now):
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', finished = ? "
+            "WHERE status = 'running' AND heartbeat < ?",
+            (now, now - self.lease)
+        )
+        cutoff = now - self.ttl
+        db.execute("DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished < ?)", (cutoff,))
+        db.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+        db.execute("DELETE FROM job_users WHERE served < ?", (cutoff,))
+
+    def _status(self, job_id):
+        with self._transaction(immediate=False) as db:
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _add_event(self, job_id, event):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO job_events (job_id, seq, event) SELECT id, events, ? FROM jobs WHERE id = ?",
+                (json.dumps(event), job_id)
+            )
+            db.execute(
+                "UPDATE jobs SET events = events + 1, completed = completed + ?, heartbeat = ? WHERE id = ?",
+                (int(event.get('type') == 'file'), time.time(), job_id)
+            )
+
+    def _set_total(self, job_id, total):
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+
+    def _job_dict(self, job_id, since):
+        with self._transaction(immediate=False) as db:
+            row = db.execute(
+                "SELECT status, description, created, started, finished, completed, total, events, error "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            events = db.execute(
+                "SELECT event FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, since)
+            ).fetchall()
+        if row is None:
+            return None
+        status, description, created, started, finished, completed, total, count, error = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "description": description,
+            "created": created,
+            "started": started,
+            "finished": finished,
+            "progress": {"completed": completed, "total": total},
+            "events": [json.loads(event) for (event,) in events],
+            "next": count,
+            "error": error
+        }
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for prompt budgeting"""
+    return len(text) // 4 + 1
+
+class PromptPlanner:
+    """Split large files into token-budgeted chunks and pack small files into shared requests"""
+
+    # Top-level definitions in the languages we usually see, used as chunk boundaries
+    BOUNDARY = re.compile(
+        r'^(?:@|(?:async\s+def|def|class|function|async\s+function|func|fn|pub\s+fn|impl|struct|'
+        r'interface|module|export|public|private|protected|internal|static)\b)'
+    )
+    FILE_MARKER = "### FILE:"
+
+    def __init__(self, chunk_tokens=6000, pack_tokens=6000, small_file_tokens=400, pack_max_files=20):
+        self.chunk_tokens = chunk_tokens
+        self.pack_tokens = pack_tokens
+        self.small_file_tokens = small_file_tokens
+        self.pack_max_files = pack_max_files
+
+    def plan(self, items):
+        """Group (index, content, text, language) items into single-file and packed units"""
+        units = []
+        pack, pack_size = [], 0
+        for item in items:
+            tokens = estimate_tokens(item[2])
+            if tokens > self.small_file_tokens:
+                units.append(("file", [item]))
+                continue
+            if pack and (pack_size + tokens > self.pack_tokens or len(pack) >= self.pack_max_files):
+                units.append(("pack" if len(pack) > 1 else "file", pack))
+                pack, pack_size = [], 0
+            pack.append(item)
+            pack_size += tokens
+        if pack:
+            units.append(("pack" if len(pack) > 1 else "file", pack))
+        return units
+
+    def needs_chunking(self, code):
+        return estimate_tokens(code) > self.chunk_tokens
+
+    def split(self, code):
+        """Split code at top-level definitions into chunks that fit the token budget"""
+        segments, current = [], []
+        previous = ''
+        for line in code.splitlines(keepends=True):
+            # Keep decorators attached to the definition that follows them
+            if current and self.BOUNDARY.match(line) and not previous.startswith('@'):
+                segments.append(''.join(current))
+                current = []
+            current.append(line)
+            if line.strip():
+                previous = line
+        if current:
+            segments.append(''.join(current))
+
+        chunks, chunk = [], ''
+        for segment in segments:
+            for piece in self._split_oversized(segment):
+                if chunk and estimate_tokens(chunk + piece) > self.chunk_tokens:
+                    chunks.append(chunk)
+                    chunk = ''
+                chunk += piece
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _split_oversized(self, segment):
+        if estimate_tokens(segment) <= self.chunk_tokens:
+            return [segment]
+        pieces, piece = [], ''
+        for line in segment.splitlines(keepends=True):
+            if piece and estimate_tokens(piece + line) > self.chunk_tokens:
+                pieces.append(piece)
+                piece = ''
+            piece += line
+        if piece:
+            pieces.append(piece)
+        return pieces
+
+    def pack_prompt(self, items):
+        """Build a single prompt covering several small files"""
+        return "\n".join(f"{self.FILE_MARKER} {item[1].path} ({item[3]})\n{item[2]}\n" for item in items)
+
+    def unpack_answer(self, answer, paths):
+        """Split a packed answer back into {path: analysis} using the file markers"""
+        sections = {}
+        path, lines = None, []
+        for line in answer.splitlines():
+            stripped = line.strip().strip('*').strip()
+            if stripped.startswith(self.FILE_MARKER):
+                if path in paths:
+                    sections[path] = '\n'.join(lines).strip()
+                header = stripped[len(self.FILE_MARKER):].replace('`', '').strip()
+                path = next((p for p in paths if header == p or header.startswith(p + ' ')), None)
+                lines = []
+            else:
+                lines.append(line)
+        if path in paths:
+            sections[path] = '\n'.join(lines).strip()
+        return {path: analysis for path, analysis in sections.items() if analysis}
+
+def git_blob_sha(data):
+    """Compute the git blob SHA of raw file contents"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def split_patterns(value):
+    return [pattern.strip() for pattern in (value or '').split(',') if pattern.strip()]
 
 class GitHubAssistant:
     def __init__(self):
         self.github_token = os.getenv('GITHUB_TOKEN')
         self.deepseek_key = os.getenv('DEEPISEEK_API_KEY')
-        self.g = Github(self.github_token)
-        self.user = self.g.get_user()
-        logger.info(f"Initialized GitHub Assistant for user: {self.user.login}")
+        self.model = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
+        self.max_workers = int(os.getenv('ANALYSIS_MAX_WORKERS', '8'))
+        # Analyses that can run at once in this process: one per request thread
+        self.request_threads = int(os.getenv('GUNICORN_THREADS', '32'))
+        # Worker processes sharing the DeepSeek quota
+        self.processes = int(os.getenv('WEB_CONCURRENCY', '1'))
+        self.repo_deadline = float(os.getenv('ANALYSIS_REPO_DEADLINE', '120'))
+        self.planner = PromptPlanner(
+            chunk_tokens=int(os.getenv('PROMPT_CHUNK_TOKENS', '6000')),
+            pack_tokens=int(os.getenv('PROMPT_PACK_TOKENS', '6000')),
+            small_file_tokens=int(os.getenv('PROMPT_SMALL_FILE_TOKENS', '400')),
+            pack_max_files=int(os.getenv('PROMPT_PACK_MAX_FILES', '20'))
+        )
+        # Clients and databases are created on first use, so importing the app
+        # does no network or disk I/O and each forked worker gets its own pools
+        self._clients = {}
+        # Reentrant because some factories build on other clients (user -> g)
+        self._clients_lock = threading.RLock()
 
-    def analyze_repository(self, repo_name):
-        """Comprehensive repository analysis"""
+    def _client(self, name, factory):
+        client = self._clients.get(name)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = factory()
+                    self._clients[name] = client
+                    logger.info(f"Initialized {name} client")
+        return client
+
+    @property
+    def cache(self):
+        return self._client('cache', lambda: AnalysisCache(
+            os.getenv('ANALYSIS_CACHE_PATH', 'analysis_cache.db'),
+            memory_items=int(os.getenv('ANALYSIS_CACHE_MEMORY_ITEMS', '256')),
+            max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '10000')),
+            max_age=float(os.getenv('ANALYSIS_CACHE_MAX_AGE', str(30 * 24 * 3600)))
+        ))
+
+    @property
+    def index(self):
+        return self._client('index', lambda: RepositoryIndex(os.getenv('REPO_INDEX_PATH', 'repo_index.db')))
+
+    @property
+    def deepseek(self):
+        return self._client('deepseek', lambda: HTTPClient(
+            os.getenv('DEEPSEEK_API_BASE', 'https://api.deepseek.com/v1'),
+            headers={
+                'Authorization': f'Bearer {self.deepseek_key}',
+                'Content-Type': 'application/json'
+            },
+            # Shared by every concurrent analysis, each running up to max_workers requests
+            pool_size=int(os.getenv('DEEPSEEK_POOL_SIZE', str(self.max_workers * self.request_threads))),
+            pool_block=True,
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.getenv('DEEPSEEK_READ_TIMEOUT', '120')),
+            max_retries=int(os.getenv('HTTP_MAX_RETRIES', '4')),
+            max_rate_limit_wait=float(os.getenv('HTTP_MAX_RATE_LIMIT_WAIT', '300')),
+            # Requests per second across all worker processes, split evenly; 0 disables the limit
+            rate=float(os.getenv('DEEPSEEK_RATE_LIMIT', '10')) / self.processes,
+            burst=max(1, int(os.getenv('DEEPSEEK_RATE_BURST', '20')) // self.processes)
+        ))
+
+    @property
+    def g(self):
+        return self._client('github', lambda: Github(
+            self.github_token,
+            base_url=os.getenv('GITHUB_API_URL', 'https://api.github.com'),
+            timeout=int(os.getenv('GITHUB_TIMEOUT', '15')),
+            pool_size=self.request_threads,
+            # GithubRetry backs off on 5xx and waits out primary/secondary rate limits
+            retry=MeteredGithubRetry(total=int(os.getenv('HTTP_MAX_RETRIES', '4'))),
+            seconds_between_requests=float(os.getenv('GITHUB_MIN_REQUEST_INTERVAL', '0.25'))
+        ))
+
+    @property
+    def github_api(self):
+        # For quick lookups on the request path: one retry, and never wait out a rate limit
+        return self._client('github_api', lambda: HTTPClient(
+            os.getenv('GITHUB_API_URL', 'https://api.github.com'),
+            headers={
+                'Authorization': f'token {self.github_token}',
+                'Accept': 'application/vnd.github+json'
+            },
+            pool_size=self.request_threads,
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.getenv('GITHUB_TIMEOUT', '15')),
+            max_retries=1,
+            max_rate_limit_wait=0
+        ))
+
+    @property
+    def fetcher(self):
+        return self._client('fetcher', lambda: RepositoryFetcher(
+            HTTPClient(
+                os.getenv('GITHUB_API_URL', 'https://api.github.com'),
+                pool_size=self.request_threads,
+                connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+                read_timeout=float(os.getenv('GITHUB_TIMEOUT', '15')),
+                max_retries=int(os.getenv('HTTP_MAX_RETRIES', '4')),
+                max_rate_limit_wait=float(os.getenv('HTTP_MAX_RATE_LIMIT_WAIT', '300'))
+            ),
+            include=split_patterns(os.getenv('ANALYSIS_INCLUDE')),
+            exclude=split_patterns(os.getenv('ANALYSIS_EXCLUDE')),
+            max_file_size=int(os.getenv('ANALYSIS_MAX_FILE_SIZE', '200000'))
+        ))
+
+    @property
+    def chunk_pool(self):
+        # Separate from the per-repository file pool, which blocks on these futures
+        return self._client('chunk_pool', lambda: ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='analysis-chunk'
+        ))
+
+    @property
+    def user(self):
+        return self._client('user', lambda: self.g.get_user())
+
+    def is_ready(self):
+        """Whether the local stores open and the API credentials are configured"""
         try:
-            repo = self.g.get_repo(repo_name)
-            analysis = {
-                "name": repo.name,
-                "description": repo.description,
-                "stats": {
-                    "stars": repo.stargazers_count,
-                    "forks": repo.forks_count,
-                    "issues": repo.open_issues_count,
-                    "created": repo.created_at.strftime("%Y-%m-%d"),
-                    "last_update": repo.updated_at.strftime("%Y-%m-%d")
-                },
-                "files": []
-            }
+            self.cache.stats()
+            self.index.load('')
+            return bool(self.github_token and self.deepseek_key)
+        except Exception as e:
+            logger.error(f"Readiness check failed: {str(e)}")
+            return False
 
-            # Analyze contents
-            contents = repo.get_contents("")
-            for content in contents:
-                if content.type == "file":
-                    file_analysis = self.analyze_file(repo, content)
-                    analysis["files"].append(file_analysis)
+    def warm(self):
+        """Create clients and open pooled connections ahead of the first request"""
+        self.is_ready()
+        try:
+            for http in (self.fetcher.http, self.github_api, self.deepseek):
+                http.session.head(http.base_url, timeout=http.timeout)
+            logger.info(f"Warmed GitHub Assistant for user: {self.user.login}")
+        except Exception as e:
+            logger.warning(f"Could not warm API connections: {str(e)}")
 
+    def analyze_repository(self, repo_name):
+        """Comprehensive repository analysis, re-analyzing only files changed since the last run"""
+        try:
+            repo = self.get_repo(repo_name)
+            analysis = self.get_repository_summary(repo)
+            plan = self.plan_analysis(repo)
+            analyzed = self.analyze_files(repo, plan["files"])
+            self.save_analysis(repo, plan, analyzed)
+
+            analysis["files"] = sorted(list(plan["reused"].values()) + analyzed, key=lambda f: f["name"])
+            analysis["incremental"] = plan_summary(plan)
             return analysis
         except Exception as e:
             logger.error(f"Error analyzing repository {repo_name}: {str(e)}")
             raise
 
-    def analyze_file(self, repo, content):
-        """Analyze a single file"""
-        try:
-            file_content = content.decoded_content.decode('utf-8')
-            file_type = content.path.split('.')[-1] if '.' in content.path else 'unknown'
-            
-            analysis = self.get_code_analysis(file_content, file_type)
-            
+    def get_repository_summary(self, repo):
+        """Repository metadata and statistics, without file analyses"""
+        return {
+            "name": repo.name,
+            "description": repo.description,
+            "stats": {
+                "stars": repo.stargazers_count,
+                "forks": repo.forks_count,
+                "issues": repo.open_issues_count,
+                "created": repo.created_at.strftime("%Y-%m-%d"),
+                "last_update": repo.updated_at.strftime("%Y-%m-%d")
+            },
+            "files": []
+        }
+
+    @property
+    def analysis_version(self):
+        """Identifies the model and prompt that produced stored analyses"""
+        return f"{self.model}:v{PROMPT_VERSION}"
+
+    @metrics.timed("fetch")
+    def get_repo(self, repo_name):
+        """Repository metadata, timed with the other GitHub reads"""
+        return self.g.get_repo(repo_name)
+
+    @metrics.timed("fetch")
+    def head_commit(self, repo):
+        """SHA of the latest commit on the default branch"""
+        return repo.get_branch(repo.default_branch).commit.sha
+
+    @metrics.timed("fetch")
+    def resolve_head(self, repo_name):
+        """Full name and HEAD commit of a repository, failing fast instead of waiting out rate limits"""
+        response = self.github_api.get(f'/repos/{repo_name}')
+        response.raise_for_status()
+        repo = response.json()
+        response = self.github_api.get(f"/repos/{repo['full_name']}/branches/{repo['default_branch']}")
+        response.raise_for_status()
+        return repo['full_name'], response.json()['commit']['sha']
+
+    def plan_analysis(self, repo):
+        """Compare HEAD with the repository index and fetch only added or modified files"""
+        commit_sha = self.head_commit(repo)
+        state = self.index.load(repo.full_name)
+        previous_commit = state["commit"]
+        previous = state["files"]
+        if previous and state["version"] != self.analysis_version:
+            # Analyses from another model or prompt version are not reusable
+            logger.info(f"Re-analyzing {repo.full_name}: index built with {state['version']}, now {self.analysis_version}")
+            previous = {}
+        elif previous_commit == commit_sha and state["complete"]:
             return {
-                "name": content.path,
-                "type": file_type,
-                "size": len(file_content),
-                "content": file_content[:500] + "..." if len(file_content) > 500 else file_content,
-                "analysis": analysis
+                "commit": commit_sha,
+                "previous_commit": previous_commit,
+                "reused": {path: file for path, (sha, file) in previous.items()},
+                "blob_shas": {path: sha for path, (sha, file) in previous.items()},
+                "files": [],
+                "deleted": []
             }
+
+        wanted, truncated = self.fetcher.list_tree(repo, commit_sha)
+        unchanged = {path for path, sha in wanted.items() if path in previous and previous[path][0] == sha}
+        changed = {path: sha for path, sha in wanted.items() if path not in unchanged}
+        files = self.fetcher.download(repo, commit_sha, changed, truncated)
+        if truncated:
+            # The tree was incomplete, so compare the SHAs of the downloaded blobs instead
+            wanted = {f.path: f.sha for f in files}
+            unchanged = {f.path for f in files if f.path in previous and previous[f.path][0] == f.sha}
+            files = [f for f in files if f.path not in unchanged]
+        else:
+            # download() drops binary blobs and non-files from changed; they are not analyzed
+            wanted = {path: sha for path, sha in wanted.items() if path in unchanged or path in changed}
+
+        return {
+            "commit": commit_sha,
+            "previous_commit": previous_commit,
+            "reused": {path: previous[path][1] for path in unchanged},
+            "blob_shas": wanted,
+            "files": files,
+            "deleted": sorted(path for path in previous if path not in wanted)
+        }
+
+    def save_analysis(self, repo, plan, analyzed):
+        """Record successful analyses; the commit is only marked complete when nothing failed"""
+        stored = {path: (plan["blob_shas"][path], file) for path, file in plan["reused"].items()}
+        complete = True
+        for file in analyzed:
+            if 'error' in file or not file.get('analysis'):
+                complete = False
+            elif file["name"] in plan["blob_shas"]:
+                stored[file["name"]] = (plan["blob_shas"][file["name"]], file)
+        self.index.save(repo.full_name, plan["commit"], complete, self.analysis_version, stored)
+
+    def analyze_files(self, repo, files):
+        """Analyze files in parallel, keeping the original file order"""
+        results = [None] * len(files)
+        for index, file_analysis in self.iter_file_analyses(repo, files):
+            results[index] = file_analysis
+        return results
+
+    def iter_file_analyses(self, repo, files):
+        """Yield (index, analysis) pairs as files finish, within the repository deadline"""
+        if not files:
+            return
+
+        items = []
+        for index, content in enumerate(files):
+            try:
+                with metrics.time("decode"):
+                    file_content = content.decoded_content.decode('utf-8')
+                items.append((index, content, file_content, file_language(content.path)))
+            except Exception as e:
+                logger.error(f"Error decoding file {content.path}: {str(e)}")
+                yield index, {"name": content.path, "error": str(e)}
+        units = self.planner.plan(items)
+        if not units:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(units))))
+        try:
+            pending = {}
+            for kind, unit in units:
+                if kind == "pack":
+                    future = executor.submit(self.analyze_packed_files, unit)
+                else:
+                    future = executor.submit(self.analyze_decoded_file, *unit[0])
+                pending[future] = [item[0] for item in unit]
+            try:
+                for future in as_completed(pending, timeout=self.repo_deadline):
+                    yield from self._unit_results(future, pending.pop(future), files)
+            except FuturesTimeoutError:
+                remaining = sum(len(indexes) for future, indexes in pending.items() if not future.done())
+                logger.warning(f"{remaining} of {len(files)} files did not finish within {self.repo_deadline}s")
+
+            for future, indexes in sorted(pending.items(), key=lambda item: item[1][0]):
+                # Units that finished between the deadline and now still count
+                if future.done() and not future.cancelled():
+                    yield from self._unit_results(future, indexes, files)
+                    continue
+                future.cancel()
+                for index in indexes:
+                    yield index, {
+                        "name": files[index].path,
+                        "error": f"Analysis timed out after {self.repo_deadline}s"
+                    }
+        finally:
+            # Don't block the request on stragglers past the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _unit_results(self, future, indexes, files):
+        """Yield the (index, analysis) pairs of a finished unit, or an error for each of its files"""
+        try:
+            yield from future.result()
+        except Exception as e:
+            logger.error(f"Error analyzing files {indexes}: {str(e)}")
+            for index in indexes:
+                yield index, {"name": files[index].path, "error": str(e)}
+
+    def analyze_decoded_file(self, index, content, file_content, file_type, lookup=True):
+        """Analyze one decoded file, chunking it if it exceeds the token budget"""
+        try:
+            analysis = self.analyze_code(file_content, file_type, sha=content.sha, lookup=lookup)
+            return [(index, file_result(content, file_content, file_type, analysis))]
         except Exception as e:
             logger.error(f"Error analyzing file {content.path}: {str(e)}")
-            return {
+            return [(index, {
                 "name": content.path,
                 "error": str(e)
-            }
+            })]
+
+    def analyze_packed_files(self, items):
+        """Analyze several small files with one request, falling back per file if the answer can't be split"""
+        results, misses = [], []
+        for item in items:
+            index, content, file_content, file_type = item
+            cached = self.cache.get(AnalysisCache.make_key(content.sha, file_type, self.model))
+            if cached is not None:
+                results.append((index, file_result(content, file_content, file_type, cached)))
+            else:
+                misses.append(item)
+
+        sections = {}
+        if len(misses) > 1:
+            answer = self.complete(
+                "You are a code analysis expert. Analyze each of the following files separately. "
+                f"Start the analysis of every file with a line '{PromptPlanner.FILE_MARKER} <path>' "
+                "using the exact path given.",
+                self.planner.pack_prompt(misses)
+            )
+            if answer:
+                sections = self.planner.unpack_answer(answer, [item[1].path for item in misses])
+
+        for item in misses:
+            index, content, file_content, file_type = item
+            analysis = sections.get(content.path)
+            if analysis is not None:
+                self.cache.set(AnalysisCache.make_key(content.sha, file_type, self.model), analysis)
+                results.append((index, file_result(content, file_content, file_type, analysis)))
+            else:
+                # Already a cache miss above, so don't look it up (and count it) again
+                results.extend(self.analyze_decoded_file(*item, lookup=False))
+        return results
+
+    def analyze_code(self, code, language, sha=None, lookup=True):
+        """Analyze code, map-reducing over chunks when it is too large for one request"""
+        if not self.planner.needs_chunking(code):
+            return self.get_code_analysis(code, language, sha=sha, lookup=lookup)
+
+        content_id = sha or hashlib.sha256(code.encode('utf-8')).hexdigest()
+        key = AnalysisCache.make_key(content_id, language, self.model)
+        cached = self.cache.get(key) if lookup else None
+        if cached is not None:
+            return cached
+
+        # Chunks run concurrently on their own pool, so a large file costs
+        # roughly one round trip plus the merge instead of one per chunk
+        chunks = self.planner.split(code)
+        futures = [self.chunk_pool.submit(self.get_code_analysis, chunk, language) for chunk in chunks]
+        partials = [future.result() for future in futures]
+        if any(partial is None for partial in partials):
+            return None
+
+        merged = self.complete(
+            f"You are a code analysis expert. These are analyses of consecutive parts of one {language} file. "
+            "Merge them into a single coherent analysis of the whole file.",
+            "\n\n".join(f"Part {i}/{len(partials)}:\n{partial}" for i, partial in enumerate(partials, 1))
+        )
+        if merged is not None:
+            self.cache.set(key, merged)
+        return merged
 
-    def get_code_analysis(self, code, language):
-        """Get AI analysis of code"""
+    def get_code_analysis(self, code, language, sha=None, lookup=True):
+        """Get AI analysis of code, reusing cached results for unchanged content"""
+        content_id = sha or hashlib.sha256(code.encode('utf-8')).hexdigest()
+        key = AnalysisCache.make_key(content_id, language, self.model)
+        cached = self.cache.get(key) if lookup else None
+        if cached is not None:
+            return cached
+
+        analysis = self.complete(f"You are a code analysis expert. Analyze this {language} code.", code)
+        if analysis is not None:
+            self.cache.set(key, analysis)
+        return analysis
+
+    @metrics.timed("llm")
+    def complete(self, system_prompt, user_content):
+        """Run one DeepSeek chat completion, returning None on failure"""
+        metrics.increment("llm_requests")
         try:
-            response = requests.post(
-                'https://api.deepseek.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {self.deepseek_key}',
-                    'Content-Type': 'application/json'
-                },
+            response = self.deepseek.post(
+                '/chat/completions',
                 json={
-                    'model': 'deepseek-chat',
+                    'model': self.model,
                     'messages': [
-                        {"role": "system", "content": f"You are a code analysis expert. Analyze this {language} code."},
-                        {"role": "user", "content": code}
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content}
                     ]
                 }
             )
@@ -99,6 +1424,7 @@ class GitHubAssistant:
             return response.json()['choices'][0]['message']['content']
         except Exception as e:
             logger.error(f"Error getting code analysis: {str(e)}")
+            metrics.increment("llm_errors")
             return None
 
     def create_pull_request(self, repo_name, title, body, base="main"):
@@ -116,6 +1442,123 @@ class GitHubAssistant:
             logger.error(f"Error creating PR: {str(e)}")
             raise
 
+def file_language(path):
+    return path.split('.')[-1] if '.' in path else 'unknown'
+
+def file_result(content, file_content, file_type, analysis):
+    """Build the per-file analysis entry shown to users"""
+    return {
+        "name": content.path,
+        "type": file_type,
+        "size": len(file_content),
+        "content": file_content[:500] + "..." if len(file_content) > 500 else file_content,
+        "analysis": analysis
+    }
+
+def plan_summary(plan):
+    """Counts describing how much of an incremental analysis was reused"""
+    return {
+        "commit": plan["commit"],
+        "previous_commit": plan["previous_commit"],
+        "skipped": len(plan["reused"]),
+        "analyzed": len(plan["files"]),
+        "deleted": len(plan["deleted"])
+    }
+
+@metrics.timed("format")
+def format_incremental_summary(summary):
+    """Format how many files were reused from the previous analysis"""
+    if not summary["previous_commit"]:
+        return f"🔍 First analysis at {summary['commit'][:7]}: analyzing {summary['analyzed']} files\n"
+    if summary["previous_commit"] == summary["commit"]:
+        if not summary["analyzed"]:
+            return f"✅ No changes since {summary['commit'][:7]}: reused {summary['skipped']} analyses\n"
+        # Only an incomplete previous run leaves files to analyze at the same commit
+        return (
+            f"🔁 Resuming analysis at {summary['commit'][:7]}: analyzing {summary['analyzed']} files, "
+            f"skipped {summary['skipped']} already analyzed\n"
+        )
+    return (
+        f"🔁 Changes since {summary['previous_commit'][:7]} → {summary['commit'][:7]}: "
+        f"analyzing {summary['analyzed']} changed files, skipped {summary['skipped']} unchanged, "
+        f"dropped {summary['deleted']} deleted\n"
+    )
+
+@metrics.timed("format")
+def format_repository_header(analysis):
+    """Format the statistics header of a repository analysis"""
+    response = f"Analysis of {analysis['name']}:\n\n"
+    response += f"📊 Statistics:\n"
+    response += f"• Stars: {analysis['stats']['stars']}\n"
+    response += f"• Forks: {analysis['stats']['forks']}\n"
+    response += f"• Open Issues: {analysis['stats']['issues']}\n"
+    response += f"• Created: {analysis['stats']['created']}\n"
+    response += f"• Last Update: {analysis['stats']['last_update']}\n\n"
+    response += "📁 Files Analysis:\n"
+    return response
+
+@metrics.timed("format")
+def format_file_analysis(file):
+    """Format the analysis of a single file"""
+    response = f"\n### {file['name']} ###\n"
+    if 'error' in file:
+        response += f"Error: {file['error']}\n"
+    else:
+        response += f"Type: {file['type']}\n"
+        if file['analysis']:
+            response += f"Analysis:\n{file['analysis']}\n"
+        response += f"\nPreview:\n```\n{file['content']}\n```\n"
+    return response
+
+def repository_analysis_events(repo_name):
+    """Yield analysis events: the stats header first, then one event per finished file"""
+    try:
+        repo = assistant.get_repo(repo_name)
+        yield {'type': 'header', 'response': format_repository_header(assistant.get_repository_summary(repo))}
+
+        plan = assistant.plan_analysis(repo)
+        summary = plan_summary(plan)
+        yield {'type': 'status', 'response': format_incremental_summary(summary), **summary}
+
+        for file in sorted(plan["reused"].values(), key=lambda f: f["name"]):
+            yield {'type': 'file', 'name': file['name'], 'cached': True, 'response': format_file_analysis(file)}
+
+        analyzed = []
+        for index, file in assistant.iter_file_analyses(repo, plan["files"]):
+            analyzed.append(file)
+            yield {'type': 'file', 'index': index, 'name': file['name'], 'response': format_file_analysis(file)}
+        assistant.save_analysis(repo, plan, analyzed)
+        yield {'type': 'done', 'files': len(plan["reused"]) + len(analyzed), **summary}
+    except Exception as e:
+        logger.error(f"Error streaming analysis of {repo_name}: {str(e)}")
+        yield {'type': 'error', 'error': str(e)}
+
+def stream_repository_analysis(repo_name):
+    """Yield NDJSON lines for the events of a repository analysis"""
+    for event in repository_analysis_events(repo_name):
+        yield json.dumps(event) + "\n"
+
+def parse_repo_name(message):
+    """Extract owner/repo from an "analyze repository" message"""
+    return next((p for p in message.split() if '/' in p), None)
+
+def parse_improve_code(message):
+    """Extract the code from an "improve: ..." message"""
+    return message.split("improve:", 1)[1].strip() if "improve:" in message else ""
+
+def run_repository_job(job, repo_name):
+    for event in repository_analysis_events(repo_name):
+        if event['type'] == 'status':
+            job.set_total(event['skipped'] + event['analyzed'])
+        elif event['type'] == 'error':
+            raise RuntimeError(event['error'])
+        job.add_event(event)
+
+def run_improve_job(job, code):
+    job.set_total(1)
+    analysis = assistant.get_code_analysis(code, "python")
+    job.add_event({'type': 'file', 'name': 'improve', 'response': f"Code Analysis:\n{analysis}"})
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
@@ -123,49 +1566,51 @@ CORS(app)
 # Initialize GitHub Assistant
 assistant = GitHubAssistant()
 
+# Background analysis jobs, shared by every worker process through one SQLite file
+jobs = JobQueue(
+    os.getenv('JOB_STORE_PATH', 'jobs.db'),
+    runners={'repository': run_repository_job, 'improve': run_improve_job},
+    workers=int(os.getenv('JOB_WORKERS', '2')),
+    ttl=float(os.getenv('JOB_TTL', '3600')),
+    lease=float(os.getenv('JOB_LEASE', '60'))
+)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         message = request.json.get('message', '').lower()
-        logger.info(f"Received message: {message}")
+        # Messages can carry whole files of code; log only a short prefix, and only when debugging
+        logger.debug(f"Received message ({len(message)} chars): {message[:80]}")
 
         if "analyze" in message and "repository" in message:
             # Extract repository name
-            parts = message.split()
-            repo_name = next((p for p in parts if '/' in p), None)
+            repo_name = parse_repo_name(message)
             
             if not repo_name:
                 return jsonify({
                     'response': "Please provide repository name in format owner/repo. Example: analyze repository aviadkim/deep"
                 })
 
+            if request.json.get('stream'):
+                return Response(
+                    stream_with_context(stream_repository_analysis(repo_name)),
+                    mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+                )
+
             analysis = assistant.analyze_repository(repo_name)
             
             # Format response
-            response = f"Analysis of {analysis['name']}:\n\n"
-            response += f"📊 Statistics:\n"
-            response += f"• Stars: {analysis['stats']['stars']}\n"
-            response += f"• Forks: {analysis['stats']['forks']}\n"
-            response += f"• Open Issues: {analysis['stats']['issues']}\n"
-            response += f"• Created: {analysis['stats']['created']}\n"
-            response += f"• Last Update: {analysis['stats']['last_update']}\n\n"
-            
-            response += "📁 Files Analysis:\n"
+            response = format_repository_header(analysis)
+            response += format_incremental_summary(analysis["incremental"])
             for file in analysis['files']:
-                response += f"\n### {file['name']} ###\n"
-                if 'error' in file:
-                    response += f"Error: {file['error']}\n"
-                else:
-                    response += f"Type: {file['type']}\n"
-                    if file['analysis']:
-                        response += f"Analysis:\n{file['analysis']}\n"
-                    response += f"\nPreview:\n```\n{file['content']}\n```\n"
+                response += format_file_analysis(file)
 
             return jsonify({'response': response})
 
         elif "improve" in message:
             # Handle code improvement request
-            code = message.split("improve:", 1)[1].strip() if ":" in message else ""
+            code = parse_improve_code(message)
             if not code:
                 return jsonify({
                     'response': "Please provide code to improve. Example: improve: def hello(): print('Hello')"
@@ -188,6 +1633,70 @@ Example: analyze repository aviadkim/deep"""
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a repository analysis or code improvement and return its job ID immediately"""
+    try:
+        message = request.json.get('message', '').lower()
+        user = request.json.get('user') or request.headers.get('X-User') or request.remote_addr
+
+        if "analyze" in message and "repository" in message:
+            repo_name = parse_repo_name(message)
+            if not repo_name:
+                return jsonify({'error': "Please provide repository name in format owner/repo"}), 400
+            try:
+                full_name, commit_sha = assistant.resolve_head(repo_name)
+            except requests.RequestException as e:
+                logger.warning(f"Could not resolve HEAD of {repo_name}: {str(e)}")
+                status = 404 if getattr(e.response, 'status_code', None) == 404 else 503
+                return jsonify({'error': f"Could not look up {repo_name}: {str(e)}"}), status
+            key = f"repo:{full_name}@{commit_sha}"
+            job, deduplicated = jobs.submit(key, user, f"analyze {full_name}", 'repository', full_name)
+
+        elif "improve" in message:
+            code = parse_improve_code(message)
+            if not code:
+                return jsonify({'error': "Please provide code to improve. Example: improve: def hello(): print('Hello')"}), 400
+            key = f"improve:{hashlib.sha256(code.encode('utf-8')).hexdigest()}"
+            job, deduplicated = jobs.submit(key, user, "improve code", 'improve', code)
+
+        else:
+            return jsonify({'error': "Jobs support \"analyze repository owner/repo\" and \"improve: [code]\""}), 400
+
+        return jsonify({'job_id': job.id, 'status': job.status, 'deduplicated': deduplicated}), 202
+
+    except Exception as e:
+        logger.error(f"Error in jobs endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job progress and partial results; pass ?since=<next> to fetch only new events"""
+    job = jobs.get(job_id)
+    state = job.to_dict(since=request.args.get('since', 0, type=int)) if job else None
+    if state is None:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(state)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage timing histograms and counters summed over all workers, plus this worker's cache statistics"""
+    snapshot = metrics.shared_snapshot()
+    snapshot["cache"] = assistant.cache.stats()
+    return jsonify(snapshot)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: local stores are usable and API credentials are configured"""
+    if assistant.is_ready():
+        return jsonify({'status': 'ready'})
+    return jsonify({'status': 'not ready'}), 503
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -198,7 +1707,8 @@ if __name__ == "__main__":
     
     for port in ports:
         try:
-            app.run(debug=True, host='0.0.0.0', port=port)
+            # Development server only; see README for running under gunicorn
+            app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=port)
             break
         except OSError:
             logger.warning(f"Port {port} is in use, trying next port...")
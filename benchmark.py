@@ -0,0 +1,364 @@
+"""Offline benchmark for the /chat analyze and improve flows and /jobs.
+
+Starts local stand-ins for the GitHub REST API and the DeepSeek
+chat-completions API, points app.py at them, drives /chat and /jobs with
+concurrent requests and prints latency percentiles, failed requests and
+failed files, plus the app's /metrics snapshot.
+
+Example:
+    python benchmark.py --files 200 --llm-latency 0.5 --concurrency 8 --requests 20
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def generate_repo(files, file_size, seed):
+    """Deterministic fake repository: {path: bytes}, mixing tiny configs and larger modules"""
+    rng = random.Random(seed)
+    contents = {}
+    for i in range(files):
+        if i % 4 == 0:
+            path = f"config/settings_{i}.json"
+            contents[path] = json.dumps({"name": f"setting{i}", "enabled": bool(i % 2)}).encode()
+            continue
+        path = f"src/pkg_{i % 7}/module_{i}.py"
+        lines = []
+        while sum(len(line) for line in lines) < rng.randint(file_size // 2, file_size * 2):
+            n = len(lines)
+            lines.append(f"def function_{n}(x):\n    return x * {rng.randint(1, 99)}\n\n")
+        contents[path] = "".join(lines).encode()
+    return contents
+
+
+class StubServer:
+    """Run a BaseHTTPRequestHandler subclass on a free local port in a daemon thread"""
+
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate(self):
+        """Apply configured latency; return True if this request should fail"""
+        if self.latency:
+            time.sleep(self.latency)
+        return random.random() < self.error_rate
+
+
+def github_handler(repos, latency, error_rate):
+    """Serve the GitHub REST endpoints app.py uses for a set of fake repositories"""
+    commit_sha = hashlib.sha1(b"benchmark-commit").hexdigest()
+    archives = {}
+    for full_name, contents in repos.items():
+        prefix = f"{full_name.replace('/', '-')}-{commit_sha[:7]}"
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for path, data in contents.items():
+                info = tarfile.TarInfo(f"{prefix}/{path}")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        archives[full_name] = buffer.getvalue()
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    class GitHubHandler(StubHandler):
+        def do_GET(self):
+            base = f"http://{self.headers['Host']}"
+            path = urlparse(self.path).path
+            if path.startswith("/_archive/"):
+                full_name = path[len("/_archive/"):].rsplit("/", 1)[0]
+                body = archives[full_name]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            if self.simulate():
+                return self.send_json({"message": "Server Error"}, status=502)
+            if path == "/user":
+                return self.send_json({"login": "benchmark", "url": f"{base}/users/benchmark"})
+
+            match = re.match(r"^/repos/([^/]+/[^/]+)(/.*)?$", path)
+            if not match or match.group(1) not in repos:
+                return self.send_json({"message": "Not Found"}, status=404)
+            full_name, rest = match.group(1), match.group(2) or ""
+            repo_url = f"{base}/repos/{full_name}"
+
+            if rest == "":
+                return self.send_json({
+                    "id": 1, "name": full_name.split("/")[1], "full_name": full_name, "url": repo_url,
+                    "description": "Benchmark repository", "default_branch": "main",
+                    "stargazers_count": 42, "forks_count": 7, "open_issues_count": 3,
+                    "created_at": created, "updated_at": created
+                })
+            if rest.startswith("/branches/"):
+                return self.send_json({
+                    "name": rest[len("/branches/"):],
+                    "commit": {"sha": commit_sha, "url": f"{repo_url}/commits/{commit_sha}"}
+                })
+            if rest.startswith("/git/trees/"):
+                return self.send_json({
+                    "sha": commit_sha, "url": f"{repo_url}/git/trees/{commit_sha}", "truncated": False,
+                    "tree": [
+                        {"path": p, "mode": "100644", "type": "blob", "sha": git_blob_sha(data),
+                         "size": len(data), "url": f"{repo_url}/git/blobs/{git_blob_sha(data)}"}
+                        for p, data in repos[full_name].items()
+                    ]
+                })
+            if rest.startswith("/tarball/"):
+                self.send_response(302)
+                self.send_header("Location", f"{base}/_archive/{full_name}/{rest[len('/tarball/'):]}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            return self.send_json({"message": "Not Found"}, status=404)
+
+    GitHubHandler.latency = latency
+    GitHubHandler.error_rate = error_rate
+    return GitHubHandler
+
+
+def deepseek_handler(latency, error_rate):
+    """Serve /v1/chat/completions, answering packed prompts with one section per file"""
+
+    class DeepSeekHandler(StubHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.simulate():
+                return self.send_json({"error": "rate limited"}, status=429, headers={"Retry-After": "0.1"})
+            user_content = payload["messages"][-1]["content"]
+            paths = re.findall(r"^### FILE: (\S+)", user_content, re.M)
+            if paths:
+                content = "\n".join(f"### FILE: {path}\nStub analysis of {path}." for path in paths)
+            else:
+                content = f"Stub analysis of {len(user_content)} characters."
+            self.send_json({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    DeepSeekHandler.latency = latency
+    DeepSeekHandler.error_rate = error_rate
+    return DeepSeekHandler
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+FILE_SECTION = re.compile(r"^### (.+) ###$", re.M)
+
+
+def file_failures(text):
+    """Count formatted file sections that report an error or came back without an analysis"""
+    sections = FILE_SECTION.split(text)[2::2]
+    return sum(1 for section in sections if "\nError: " in "\n" + section or "\nAnalysis:\n" not in section)
+
+
+def event_failures(events):
+    """Return (request failed, failed files) for a list of analysis events"""
+    failed = any(event.get("type") == "error" for event in events)
+    files = sum(file_failures(event.get("response", "")) for event in events if event.get("type") == "file")
+    return failed, files
+
+
+def run_load(session, url, messages, concurrency, stream):
+    """POST each message to /chat and collect latency, time-to-first-byte and failures"""
+    def send(message):
+        start = time.perf_counter()
+        response = session.post(f"{url}/chat", json={"message": message, "stream": stream}, stream=stream)
+        first_byte, chunks = None, []
+        for chunk in response.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            chunks.append(chunk)
+        latency = time.perf_counter() - start
+        if response.status_code >= 400:
+            return latency, first_byte, True, 0
+        body = b"".join(chunks).decode("utf-8")
+        if "application/x-ndjson" in response.headers.get("Content-Type", ""):
+            # Streams always answer 200; failures arrive as error events
+            failed, files = event_failures([json.loads(line) for line in body.splitlines() if line.strip()])
+            return latency, first_byte, failed, files
+        text = json.loads(body).get("response", "")
+        return latency, first_byte, False, file_failures(text) if text.startswith("Analysis of") else 0
+
+    return collect(send, messages, concurrency)
+
+
+def run_jobs(session, url, messages, concurrency, poll_interval=0.05, timeout=600):
+    """Submit each message to /jobs and poll until it finishes; latency is submit-to-done"""
+    deduplicated = []
+
+    def send(message):
+        start = time.perf_counter()
+        response = session.post(f"{url}/jobs", json={"message": message, "user": "benchmark"})
+        if response.status_code != 202:
+            return time.perf_counter() - start, None, True, 0
+        first_byte = time.perf_counter() - start
+        deduplicated.append(response.json()["deduplicated"])
+        job_id, since, events = response.json()["job_id"], 0, []
+        while time.perf_counter() - start < timeout:
+            job = session.get(f"{url}/jobs/{job_id}", params={"since": since}).json()
+            events.extend(job["events"])
+            since = job["next"]
+            if job["status"] in ("done", "failed"):
+                failed, files = event_failures(events)
+                return time.perf_counter() - start, first_byte, failed or job["status"] == "failed", files
+            time.sleep(poll_interval)
+        return time.perf_counter() - start, first_byte, True, 0
+
+    result = collect(send, messages, concurrency)
+    result["deduplicated"] = sum(deduplicated)
+    return result
+
+
+def collect(send, messages, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, messages))
+    return {
+        "latencies": [r[0] for r in results],
+        "first_bytes": [r[1] for r in results if r[1] is not None],
+        "errors": sum(r[2] for r in results),
+        "file_errors": sum(r[3] for r in results),
+        "wall": time.perf_counter() - start
+    }
+
+
+def report(name, result):
+    latencies, first_bytes = result["latencies"], result["first_bytes"]
+    print(f"\n== {name}: {len(latencies)} requests, {result['errors']} failed requests, "
+          f"{result['file_errors']} failed files, {len(latencies) / result['wall']:.2f} req/s ==")
+    print(f"latency  p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s "
+          f"p99={percentile(latencies, 99):.3f}s max={max(latencies):.3f}s mean={statistics.mean(latencies):.3f}s")
+    if first_bytes:
+        print(f"ttfb     p50={percentile(first_bytes, 50):.3f}s p95={percentile(first_bytes, 95):.3f}s")
+    if "deduplicated" in result:
+        print(f"jobs     deduplicated={result['deduplicated']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flow", choices=["analyze", "improve", "jobs", "all"], default="all")
+    parser.add_argument("--repos", type=int, default=1, help="distinct repositories to spread requests over")
+    parser.add_argument("--files", type=int, default=50, help="files per repository")
+    parser.add_argument("--file-size", type=int, default=2000, help="typical module size in bytes")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--stream", action="store_true", help="use the streaming /chat mode")
+    parser.add_argument("--github-latency", type=float, default=0.05)
+    parser.add_argument("--github-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    repos = {f"bench/repo{i}": generate_repo(args.files, args.file_size, args.seed + i) for i in range(args.repos)}
+    github = StubServer(github_handler(repos, args.github_latency, args.github_error_rate)).start()
+    deepseek = StubServer(deepseek_handler(args.llm_latency, args.llm_error_rate)).start()
+    workdir = tempfile.mkdtemp(prefix="deep-bench-")
+
+    # Configure app.py before importing it; load_dotenv does not override these
+    os.environ.update({
+        "GITHUB_TOKEN": "benchmark",
+        "DEEPISEEK_API_KEY": "benchmark",
+        "GITHUB_API_URL": github.url,
+        "DEEPSEEK_API_BASE": f"{deepseek.url}/v1",
+        "GITHUB_MIN_REQUEST_INTERVAL": "0",
+        "LOG_LEVEL": "WARNING",
+        "ANALYSIS_CACHE_PATH": os.path.join(workdir, "analysis_cache.db"),
+        "REPO_INDEX_PATH": os.path.join(workdir, "repo_index.db"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.db"),
+        "METRICS_PATH": os.path.join(workdir, "metrics.db"),
+    })
+    import requests
+    from werkzeug.serving import make_server
+    import app as deep_app
+    # Werkzeug logs every request at INFO, and the jobs flow polls constantly
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, deep_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    session = requests.Session()
+    print(f"Stub GitHub at {github.url}, stub DeepSeek at {deepseek.url}, app at {url}")
+
+    names = list(repos)
+    analyze_messages = [f"analyze repository {names[i % len(names)]}" for i in range(args.requests)]
+    improve_messages = [f"improve: def f{i}(x): return x + {i}" for i in range(args.requests)]
+
+    if args.flow in ("analyze", "all"):
+        report("analyze (cold)", run_load(session, url, analyze_messages, args.concurrency, args.stream))
+        report("analyze (warm)", run_load(session, url, analyze_messages, args.concurrency, args.stream))
+
+    if args.flow in ("improve", "all"):
+        report("improve (cold)", run_load(session, url, improve_messages, args.concurrency, False))
+        report("improve (warm)", run_load(session, url, improve_messages, args.concurrency, False))
+
+    if args.flow in ("jobs", "all"):
+        # Fresh improve payloads so identical concurrent submissions collapse into one job
+        messages = [f"improve: def job{i % 3}(x): return x" for i in range(args.requests)]
+        report("jobs (improve)", run_jobs(session, url, messages, args.concurrency))
+        report("jobs (analyze)", run_jobs(session, url, analyze_messages, args.concurrency))
+
+    snapshot = session.get(f"{url}/metrics").json()
+    print("\n== stages ==")
+    for stage, histogram in sorted(snapshot["stages"].items()):
+        print(f"{stage:8} count={histogram['count']:<6} mean={histogram['mean']:.4f}s total={histogram['sum']:.3f}s")
+    print("\n== counters ==")
+    for counter, value in sorted(snapshot["counters"].items()):
+        print(f"{counter}: {value}")
+    print(f"cache: {snapshot['cache']}")
+
+    server.shutdown()
+    github.stop()
+    deepseek.stop()
+
+
+if __name__ == "__main__":
+    main()
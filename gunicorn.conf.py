@@ -0,0 +1,35 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+import threading
+
+bind = os.getenv('BIND', '0.0.0.0:5001')
+# One process per core for the CPU-bound parts (decoding, formatting, JSON); requests
+# spend most of their time waiting on GitHub and DeepSeek, so threads carry the rest
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+# app.py sizes its connection pools and per-process share of the DeepSeek rate limit from these
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+# Repository analyses and streamed responses can run for minutes
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+keepalive = 5
+# Import app.py once in the master; clients are created lazily, so nothing is shared across forks
+preload_app = True
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+accesslog = os.getenv('ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    from app import assistant, jobs, metrics
+    # Every worker runs jobs from the shared store and publishes its metrics for /metrics
+    jobs.start()
+    metrics.start_publishing(float(os.getenv('METRICS_PUBLISH_INTERVAL', '5')))
+    # Open this worker's connection pools in the background so it can accept traffic immediately
+    threading.Thread(target=assistant.warm, daemon=True).start()
+
+
+def worker_exit(server, worker):
+    from app import metrics
+    metrics.publish()
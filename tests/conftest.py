@@ -0,0 +1,38 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py builds its clients lazily, so importing it here does no network or disk I/O
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from app import GitHubAssistant
+
+
+@pytest.fixture
+def assistant(tmp_path, monkeypatch):
+    """A GitHubAssistant whose cache and repository index live in tmp_path"""
+    monkeypatch.setenv('ANALYSIS_CACHE_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setenv('REPO_INDEX_PATH', str(tmp_path / 'index.db'))
+    return GitHubAssistant()
+
+
+@pytest.fixture
+def serve():
+    """Start a local HTTP server for a handler class and return its base URL"""
+    servers = []
+
+    def start(handler):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servers.append(httpd)
+        return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
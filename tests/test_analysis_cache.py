@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from app import AnalysisCache
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.db"))
+    assert cache.get("k") is None
+    cache.set("k", "analysis")
+    assert cache.get("k") == "analysis"
+
+    # A fresh instance reads the same file through the disk tier
+    reopened = AnalysisCache(str(tmp_path / "cache.db"))
+    assert reopened.get("k") == "analysis"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_memory_tier_expires(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.db"), max_age=60)
+    cache.set("k", "analysis")
+    cache._memory["k"] = ("analysis", time.time() - 120)
+    cache._db.execute("UPDATE analyses SET created = ?", (time.time() - 120,))
+    cache._db.commit()
+    assert cache.get("k") is None
+    assert "k" not in cache._memory
+
+
+def test_locked_database_is_best_effort(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AnalysisCache(path, busy_timeout=0)
+    cache.set("warm", "in memory and on disk")
+
+    blocker = sqlite3.connect(path)
+    blocker.execute("BEGIN EXCLUSIVE")
+    try:
+        # The write fails but is logged and counted; the result still lands in memory
+        cache.set("k", "analysis")
+        assert cache.get("k") == "analysis"
+        assert cache.stats()["errors"] == 1
+        # WAL keeps the disk tier readable while another connection writes
+        assert cache.get("missing") is None
+    finally:
+        blocker.rollback()
+        blocker.close()
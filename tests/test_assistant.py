@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app import metrics
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Answers the GitHub user lookup and the warm-up HEAD requests, after `failures` 502s"""
+
+    failures = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.failures:
+            type(self).failures -= 1
+            self.send_response(502)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"login": "octocat", "url": f"{self.headers['Host']}/users/octocat"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def assistant(assistant, serve, monkeypatch):
+    # Clients are built on first use, so the API URLs can be pointed at the stub afterwards
+    StubAPIHandler.failures = 0
+    url = serve(StubAPIHandler)
+    monkeypatch.setenv('GITHUB_API_URL', url)
+    monkeypatch.setenv('DEEPSEEK_API_BASE', url)
+    monkeypatch.setenv('GITHUB_MIN_REQUEST_INTERVAL', '0')
+    monkeypatch.setenv('HTTP_MAX_RETRIES', '0')
+    assistant.github_token = 'token'
+    assistant.deepseek_key = 'key'
+    return assistant
+
+
+def run_with_timeout(target, timeout=10):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{target.__name__} did not return within {timeout}s"
+
+
+def test_warm_creates_clients_without_deadlocking(assistant):
+    # The user factory resolves self.g inside the client lock
+    run_with_timeout(assistant.warm)
+    assert {'cache', 'index', 'fetcher', 'deepseek', 'github', 'user'} <= set(assistant._clients)
+    assert assistant.user.login == "octocat"
+
+    seen = []
+    run_with_timeout(lambda: seen.append(assistant.g))
+    assert seen == [assistant._clients['github']]
+
+
+def test_github_retries_are_counted(assistant, monkeypatch):
+    monkeypatch.setenv('HTTP_MAX_RETRIES', '2')
+    StubAPIHandler.failures = 2
+    before = metrics.snapshot()["counters"]
+    assert assistant.user.login == "octocat"
+    after = metrics.snapshot()["counters"]
+    assert after.get("github_retries", 0) - before.get("github_retries", 0) == 2
+    assert after.get("http_retries", 0) - before.get("http_retries", 0) == 2
@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError, wait
+
+import pytest
+
+import app
+from app import PromptPlanner, RepoFile
+
+
+def repo_files(count):
+    return [RepoFile(f"f{i}.py", f"sha{i}", f"x = {i}\n".encode()) for i in range(count)]
+
+
+@pytest.fixture
+def assistant(assistant):
+    # One request per file, so each file is its own unit of work
+    assistant.planner = PromptPlanner(small_file_tokens=0)
+    return assistant
+
+
+def stub_analysis(assistant, monkeypatch, delay):
+    lock, state = threading.Lock(), {"active": 0, "peak": 0}
+
+    def analyze(index, content, file_content, file_type, lookup=True):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(delay(index))
+        with lock:
+            state["active"] -= 1
+        return [(index, {"name": content.path, "analysis": f"analysis {index}"})]
+
+    monkeypatch.setattr(assistant, "analyze_decoded_file", analyze)
+    return state
+
+
+def test_results_keep_the_original_file_order(assistant, monkeypatch):
+    # Later files finish first
+    stub_analysis(assistant, monkeypatch, lambda index: 0.05 * (4 - index))
+    results = assistant.analyze_files(None, repo_files(5))
+    assert [file["name"] for file in results] == [f"f{i}.py" for i in range(5)]
+
+
+def test_concurrency_is_limited_to_max_workers(assistant, monkeypatch):
+    assistant.max_workers = 2
+    state = stub_analysis(assistant, monkeypatch, lambda index: 0.05)
+    assistant.analyze_files(None, repo_files(6))
+    assert state["peak"] == 2
+
+
+def test_files_past_the_deadline_time_out(assistant, monkeypatch):
+    assistant.repo_deadline = 0.2
+    stub_analysis(assistant, monkeypatch, lambda index: 2 if index == 1 else 0)
+    start = time.monotonic()
+    results = assistant.analyze_files(None, repo_files(3))
+    assert time.monotonic() - start < 1
+    assert results[0]["analysis"] == "analysis 0" and results[2]["analysis"] == "analysis 2"
+    assert results[1]["error"] == "Analysis timed out after 0.2s"
+
+
+def test_units_finishing_at_the_deadline_are_not_reported_as_timed_out(assistant, monkeypatch):
+    stub_analysis(assistant, monkeypatch, lambda index: 0.05)
+
+    def as_completed(futures, timeout=None):
+        # Everything finishes just as the deadline passes
+        wait(list(futures))
+        raise FuturesTimeoutError()
+        yield
+
+    monkeypatch.setattr(app, "as_completed", as_completed)
+    results = assistant.analyze_files(None, repo_files(3))
+    assert [file.get("analysis") for file in results] == ["analysis 0", "analysis 1", "analysis 2"]
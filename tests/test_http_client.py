@@ -0,0 +1,155 @@
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app import HTTPClient, TokenBucket
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Replies with the queued (status, headers) pairs in order, then 200"""
+
+    script = []
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests += 1
+        status, headers = self.script.pop(0) if self.script else (200, {})
+        body = b'{"ok": true}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(serve):
+    ScriptedHandler.script = []
+    ScriptedHandler.requests = 0
+    return serve(ScriptedHandler)
+
+
+def client(url, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return HTTPClient(url, connect_timeout=1, read_timeout=2, **kwargs)
+
+
+def scripted(*replies):
+    ScriptedHandler.script = list(replies)
+
+
+def test_retries_after_retry_after_seconds(server):
+    scripted((429, {"Retry-After": "0"}), (503, {"Retry-After": "0"}))
+    http = client(server)
+    response = http.get("/")
+    assert response.status_code == 200
+    assert ScriptedHandler.requests == 3
+    assert http.retries == 2
+
+
+def test_retry_after_seconds_and_http_date_are_honored(server):
+    http = client(server)
+    scripted((429, {"Retry-After": "7"}))
+    assert http._retry_delay(http.session.get(server), 0) == 7.0
+
+    scripted((503, {"Retry-After": formatdate(time.time() + 120, usegmt=True)}))
+    assert 115 <= http._retry_delay(http.session.get(server), 0) <= 120
+
+
+def test_rate_limit_reset_is_not_capped_by_max_backoff(server):
+    http = client(server, max_backoff=1)
+    scripted((403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 90)}))
+    response = http.session.get(server)
+    assert http.is_retryable(response)
+    assert 85 <= http._retry_delay(response, 0) <= 90
+
+
+def test_rate_limited_403_is_retried(server):
+    scripted((403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) - 1)}))
+    assert client(server).get("/").status_code == 200
+    assert ScriptedHandler.requests == 2
+
+
+def test_plain_403_is_not_retried(server):
+    scripted((403, {}))
+    assert client(server).get("/").status_code == 403
+    assert ScriptedHandler.requests == 1
+
+
+def test_long_rate_limit_gives_up_without_spending_retries(server):
+    scripted((429, {"X-RateLimit-Reset": str(int(time.time()) + 3600)}))
+    http = client(server, max_rate_limit_wait=60)
+    assert http.get("/").status_code == 429
+    assert ScriptedHandler.requests == 1
+    assert http.retries == 0
+
+
+def test_retry_exhaustion_returns_last_response(server):
+    scripted(*[(502, {})] * 10)
+    http = client(server, max_retries=2)
+    assert http.get("/").status_code == 502
+    assert ScriptedHandler.requests == 3
+
+
+def test_connection_errors_raise_after_retries():
+    http = client("http://127.0.0.1:9", max_retries=1)
+    with pytest.raises(Exception):
+        http.get("/")
+    assert http.retries == 1
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first token is available immediately, the other five arrive at 20/s
+    assert time.monotonic() - start >= 0.24
+
+
+def test_token_bucket_is_shared_across_threads():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 0.19
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Slow HTTP/1.1 replies that record which client connection each request used"""
+
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        type(self).connections.add(self.client_address)
+        time.sleep(0.05)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+
+def test_blocking_pool_reuses_connections_under_concurrency(serve):
+    KeepAliveHandler.connections = set()
+    http = client(serve(KeepAliveHandler), pool_size=2, pool_block=True)
+    threads = [threading.Thread(target=lambda: [http.get("/") for _ in range(3)]) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Without pool_block the extra threads open connections that are then discarded
+    assert len(KeepAliveHandler.connections) == 2
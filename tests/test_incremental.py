@@ -0,0 +1,115 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import app
+from app import RepoFile, RepositoryIndex, format_incremental_summary, git_blob_sha, plan_summary
+
+
+class FakeFetcher:
+    def __init__(self, contents):
+        self.contents = contents
+        self.tree_calls = 0
+
+    def list_tree(self, repo, ref):
+        self.tree_calls += 1
+        return {path: git_blob_sha(data) for path, data in self.contents.items()}, False
+
+    def download(self, repo, ref, wanted, truncated=False):
+        # Like RepositoryFetcher, drop binary blobs from wanted
+        for path in [path for path in wanted if b"\0" in self.contents[path]]:
+            del wanted[path]
+        return [RepoFile(path, sha, self.contents[path]) for path, sha in sorted(wanted.items())]
+
+
+@pytest.fixture
+def assistant(assistant):
+    assistant._clients['fetcher'] = FakeFetcher({"a.py": b"print(1)\n", "b.py": b"print(2)\n"})
+    return assistant
+
+
+def fake_repo(commit):
+    branch = SimpleNamespace(commit=SimpleNamespace(sha=commit))
+    return SimpleNamespace(full_name="owner/repo", default_branch="main", get_branch=lambda name: branch)
+
+
+def analyzed(files, failing=()):
+    return [
+        {"name": f.path, "error": "boom"} if f.path in failing else {"name": f.path, "analysis": "ok"}
+        for f in files
+    ]
+
+
+def run(assistant, commit, failing=()):
+    repo = fake_repo(commit)
+    plan = assistant.plan_analysis(repo)
+    assistant.save_analysis(repo, plan, analyzed(plan["files"], failing))
+    return plan
+
+
+def test_unchanged_head_reuses_everything_without_fetching(assistant):
+    first = run(assistant, "c1" * 20)
+    assert [f.path for f in first["files"]] == ["a.py", "b.py"]
+
+    second = run(assistant, "c1" * 20)
+    assert second["files"] == [] and sorted(second["reused"]) == ["a.py", "b.py"]
+    assert assistant.fetcher.tree_calls == 1
+
+
+def test_only_changed_files_are_reanalyzed(assistant):
+    run(assistant, "c1" * 20)
+    assistant.fetcher.contents = {"a.py": b"print(1)\n", "c.py": b"print(3)\n"}
+    plan = run(assistant, "c2" * 20)
+    assert [f.path for f in plan["files"]] == ["c.py"]
+    assert list(plan["reused"]) == ["a.py"] and plan["deleted"] == ["b.py"]
+
+
+def test_model_or_prompt_change_invalidates_index(assistant, monkeypatch):
+    run(assistant, "c1" * 20)
+    assistant.model = "another-model"
+    plan = run(assistant, "c1" * 20)
+    assert len(plan["files"]) == 2 and plan["reused"] == {}
+
+    monkeypatch.setattr(app, "PROMPT_VERSION", app.PROMPT_VERSION + 1)
+    assert len(run(assistant, "c1" * 20)["files"]) == 2
+
+
+def test_incomplete_run_is_resumed_and_labelled(assistant):
+    run(assistant, "c1" * 20, failing={"b.py"})
+    plan = run(assistant, "c1" * 20)
+    assert [f.path for f in plan["files"]] == ["b.py"]
+    assert plan["previous_commit"] == "c1" * 20
+    assert format_incremental_summary(plan_summary(plan)).startswith("🔁 Resuming analysis")
+
+
+def test_unchanged_complete_run_is_not_labelled_as_resumed(assistant):
+    run(assistant, "c1" * 20)
+    plan = run(assistant, "c1" * 20)
+    assert format_incremental_summary(plan_summary(plan)) == "✅ No changes since c1c1c1c: reused 2 analyses\n"
+
+
+def test_locked_index_is_best_effort(assistant, tmp_path):
+    assistant._clients['index'] = RepositoryIndex(str(tmp_path / 'index.db'), busy_timeout=0)
+    run(assistant, "c1" * 20)
+
+    blocker = sqlite3.connect(str(tmp_path / 'index.db'))
+    blocker.execute("BEGIN EXCLUSIVE")
+    try:
+        # The save fails but is logged and counted instead of failing the analysis
+        assistant.fetcher.contents["c.py"] = b"print(3)\n"
+        plan = run(assistant, "c2" * 20)
+        assert [f.path for f in plan["files"]] == ["c.py"]
+        assert assistant.index.errors == 1
+    finally:
+        blocker.rollback()
+        blocker.close()
+    # The commit that could not be saved is analyzed again next time
+    assert [f.path for f in run(assistant, "c2" * 20)["files"]] == ["c.py"]
+
+
+def test_dropped_binary_blobs_are_not_recorded(assistant):
+    assistant.fetcher.contents["blob.dat"] = b"\0\1"
+    plan = run(assistant, "c1" * 20)
+    assert [f.path for f in plan["files"]] == ["a.py", "b.py"]
+    assert "blob.dat" not in plan["blob_shas"]
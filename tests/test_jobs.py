@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import app
+from app import JobQueue
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    """JobQueues sharing one store, as separate worker processes would"""
+    def make(**runners):
+        return JobQueue(str(tmp_path / "jobs.db"), runners, workers=1, poll_interval=0.02)
+    return make
+
+
+def recorder(release, order):
+    def runner(job, payload):
+        order.append(payload)
+        release.wait(5)
+    return runner
+
+
+def test_users_are_served_round_robin(make_queue):
+    release, order = threading.Event(), []
+    queue = make_queue(block=recorder(release, order))
+    first, _ = queue.submit("a1", "alice", "job", "block", "a1")
+    wait_for(lambda: first.status == "running")
+    for key, user in [("a2", "alice"), ("a3", "alice"), ("b1", "bob")]:
+        queue.submit(key, user, "job", "block", key)
+    release.set()
+    wait_for(lambda: len(order) == 4)
+    # Bob has not been served yet, so he goes ahead of Alice's second job
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_inflight_jobs_are_deduplicated_until_they_finish(make_queue):
+    release = threading.Event()
+    queue = make_queue(block=recorder(release, []))
+    job, deduplicated = queue.submit("key", "alice", "job", "block", None)
+    assert not deduplicated
+    same, deduplicated = queue.submit("key", "bob", "job", "block", None)
+    assert same.id == job.id and deduplicated
+
+    release.set()
+    wait_for(lambda: job.status == "done")
+    fresh, deduplicated = queue.submit("key", "alice", "job", "block", None)
+    assert fresh.id != job.id and not deduplicated
+
+
+def test_failed_job_records_the_error_and_frees_its_key(make_queue):
+    def fail(job, payload):
+        raise RuntimeError("boom")
+
+    queue = make_queue(fail=fail, ok=lambda job, payload: None)
+    job, _ = queue.submit("key", "alice", "job", "fail", None)
+    wait_for(lambda: job.status == "failed")
+    state = job.to_dict()
+    assert state["error"] == "boom" and state["finished"] is not None
+    retry, deduplicated = queue.submit("key", "alice", "job", "ok", None)
+    assert retry.id != job.id and not deduplicated
+
+
+def test_finished_jobs_expire_after_ttl(make_queue):
+    queue = make_queue(ok=lambda job, payload: None)
+    job, _ = queue.submit("old", "alice", "job", "ok", None)
+    wait_for(lambda: job.status == "done")
+    assert queue.get(job.id) is not None
+
+    queue.ttl = -1
+    queue.submit("new", "alice", "job", "ok", None)
+    assert queue.get(job.id) is None
+
+
+def test_since_returns_only_new_events(make_queue):
+    release = threading.Event()
+
+    def runner(job, payload):
+        job.set_total(2)
+        job.add_event({"type": "header"})
+        job.add_event({"type": "file", "name": "a.py"})
+        release.wait(5)
+        job.add_event({"type": "file", "name": "b.py"})
+
+    queue = make_queue(run=runner)
+    job, _ = queue.submit("key", "alice", "job", "run", None)
+    wait_for(lambda: job.to_dict()["next"] == 2)
+    first = job.to_dict()
+    assert len(first["events"]) == 2 and first["progress"] == {"completed": 1, "total": 2}
+
+    release.set()
+    wait_for(lambda: job.status == "done")
+    second = job.to_dict(since=first["next"])
+    assert second["events"] == [{"type": "file", "name": "b.py"}] and second["next"] == 3
+    assert second["progress"] == {"completed": 2, "total": 2}
+
+
+def test_workers_share_jobs_through_the_store(make_queue):
+    # The accepting process has no workers running; another process's workers pick the job up
+    accepting = make_queue(ok=lambda job, payload: job.add_event({"type": "file", "payload": payload}))
+    accepting.start = lambda: None
+    job, _ = accepting.submit("key", "alice", "job", "ok", "data")
+    other = make_queue(ok=lambda job, payload: job.add_event({"type": "file", "payload": payload}))
+    _, deduplicated = other.submit("key", "bob", "job", "ok", "data")
+    assert deduplicated
+
+    other.start()
+    wait_for(lambda: job.status == "done")
+    assert other.get(job.id).to_dict()["events"] == [{"type": "file", "payload": "data"}]
+
+
+def test_jobs_of_a_dead_worker_fail_when_their_lease_lapses(make_queue):
+    queue = make_queue()
+    queue.start = lambda: None
+    job, _ = queue.submit("key", "alice", "job", "missing", None)
+    # Claimed by a process that then stopped renewing the lease
+    with queue._transaction() as db:
+        db.execute("UPDATE jobs SET status = 'running', heartbeat = ? WHERE id = ?", (time.time() - 120, job.id))
+
+    retry, deduplicated = queue.submit("key", "alice", "job", "missing", None)
+    assert not deduplicated
+    assert job.status == "failed" and "stopped" in job.to_dict()["error"]
+
+
+class GitHubHandler(BaseHTTPRequestHandler):
+    """Answers the repository and branch lookups, or reports an hour-long rate limit"""
+
+    rate_limited = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # GitHub matches owner and repository names case-insensitively
+        path = self.path.lower()
+        if self.rate_limited:
+            self.send_json(403, {"message": "API rate limit exceeded"}, {
+                "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 3600)
+            })
+        elif path.startswith("/repos/owner/repo/branches/"):
+            self.send_json(200, {"name": "main", "commit": {"sha": "c1" * 20}})
+        elif path == "/repos/owner/repo":
+            self.send_json(200, {"full_name": "Owner/Repo", "default_branch": "main"})
+        else:
+            self.send_json(404, {"message": "Not Found"})
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def client(assistant, serve, monkeypatch):
+    GitHubHandler.rate_limited = False
+    monkeypatch.setenv('GITHUB_API_URL', serve(GitHubHandler))
+    monkeypatch.setattr(app, "assistant", assistant)
+    return app.app.test_client()
+
+
+def test_repository_jobs_are_keyed_by_head_commit(client, monkeypatch, tmp_path):
+    release, runs = threading.Event(), []
+    monkeypatch.setattr(app, "jobs", JobQueue(str(tmp_path / "jobs.db"), {"repository": recorder(release, runs)}))
+
+    first = client.post("/jobs", json={"message": "analyze repository owner/repo", "user": "alice"})
+    second = client.post("/jobs", json={"message": "analyze repository owner/repo", "user": "bob"})
+    release.set()
+    assert first.status_code == second.status_code == 202
+    assert second.json["job_id"] == first.json["job_id"] and second.json["deduplicated"]
+    wait_for(lambda: runs == ["Owner/Repo"])
+
+
+def test_rate_limited_lookup_fails_fast(client):
+    GitHubHandler.rate_limited = True
+    start = time.monotonic()
+    response = client.post("/jobs", json={"message": "analyze repository owner/repo"})
+    assert response.status_code == 503
+    assert time.monotonic() - start < 5
+
+
+def test_unknown_repository_is_404(client):
+    response = client.post("/jobs", json={"message": "analyze repository owner/missing"})
+    assert response.status_code == 404
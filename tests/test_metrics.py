@@ -0,0 +1,33 @@
+from app import Metrics
+
+
+def test_shared_snapshot_sums_every_published_process(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    first, second = Metrics(path), Metrics(path)
+    first.increment("llm_requests", 2)
+    first.observe("llm", 0.2)
+    second.increment("llm_requests")
+    second.observe("llm", 0.4)
+    second.publish()
+
+    snapshot = first.shared_snapshot()
+    assert snapshot["counters"] == {"llm_requests": 3}
+    assert snapshot["stages"]["llm"]["count"] == 2
+    assert snapshot["stages"]["llm"]["buckets"]["0.25"] == 1
+    assert snapshot["stages"]["llm"]["buckets"]["0.5"] == 2
+    # Each process still reports only its own numbers locally
+    assert first.snapshot()["counters"] == {"llm_requests": 2}
+
+
+def test_republishing_replaces_the_previous_state(tmp_path):
+    metrics = Metrics(str(tmp_path / "metrics.db"))
+    metrics.increment("cache_hits")
+    metrics.publish()
+    metrics.increment("cache_hits")
+    assert metrics.shared_snapshot()["counters"] == {"cache_hits": 2}
+
+
+def test_without_a_path_the_snapshot_is_local():
+    metrics = Metrics()
+    metrics.increment("cache_misses")
+    assert metrics.shared_snapshot()["counters"] == {"cache_misses": 1}
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from app import PromptPlanner, RepoFile, estimate_tokens
+
+
+def test_split_keeps_decorators_with_their_definition():
+    code = "import os\n\n@decorator\n@other(1)\ndef first():\n    return 1\n\nclass Second:\n    pass\n"
+    chunks = PromptPlanner(chunk_tokens=12).split(code)
+    assert "".join(chunks) == code
+    assert any(chunk.startswith("@decorator\n@other(1)\ndef first():") for chunk in chunks)
+    assert not any(chunk.rstrip().endswith("@decorator") for chunk in chunks)
+
+
+def test_split_breaks_oversized_segments_by_line():
+    code = "def huge():\n" + "    value = 1\n" * 200
+    planner = PromptPlanner(chunk_tokens=50)
+    chunks = planner.split(code)
+    assert "".join(chunks) == code
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= planner.chunk_tokens for chunk in chunks)
+
+
+def test_plan_packs_small_files_and_keeps_large_ones_alone():
+    planner = PromptPlanner(small_file_tokens=10, pack_tokens=25)
+    items = [(i, RepoFile(f"f{i}.py", str(i), b""), "x" * (i * 10), "py") for i in range(1, 8)]
+    units = planner.plan(items)
+    assert [(kind, [item[0] for item in unit]) for kind, unit in units] == [
+        ("file", [4]), ("file", [5]), ("file", [6]), ("file", [7]), ("pack", [1, 2, 3])
+    ]
+
+
+def test_unpack_handles_bold_and_backticked_markers():
+    answer = (
+        "Here are the analyses.\n"
+        "### FILE: a.py\nLooks fine.\n"
+        "**### FILE: `src/b.py` (py)**\nNeeds tests.\n"
+        "### FILE: unknown.py\nIgnored.\n"
+    )
+    assert PromptPlanner().unpack_answer(answer, ["a.py", "src/b.py"]) == {
+        "a.py": "Looks fine.",
+        "src/b.py": "Needs tests."
+    }
+
+
+def item(index, path, code):
+    return (index, RepoFile(path, f"sha-{path}", code.encode()), code, "py")
+
+
+def test_missing_packed_sections_fall_back_to_single_requests(assistant, monkeypatch):
+    prompts = []
+
+    def complete(system_prompt, user_content):
+        prompts.append(user_content)
+        if "### FILE:" in user_content:
+            return "### FILE: a.py\nPacked analysis of a."
+        return "Single analysis."
+
+    monkeypatch.setattr(assistant, "complete", complete)
+    results = dict(assistant.analyze_packed_files([item(0, "a.py", "a = 1"), item(1, "b.py", "b = 2")]))
+    assert results[0]["analysis"] == "Packed analysis of a."
+    assert results[1]["analysis"] == "Single analysis."
+    assert prompts == [prompts[0], "b = 2"]
+    # One lookup per file, not a second miss for the fallback
+    assert assistant.cache.stats()["misses"] == 2
+
+
+def test_chunks_are_analyzed_concurrently(assistant, monkeypatch):
+    assistant.planner = PromptPlanner(chunk_tokens=20)
+    lock, calls = threading.Lock(), []
+
+    def complete(system_prompt, user_content):
+        with lock:
+            calls.append(user_content)
+        time.sleep(0.2)
+        return "merged" if user_content.startswith("Part 1/") else "partial"
+
+    monkeypatch.setattr(assistant, "complete", complete)
+    code = "".join(f"def f{i}():\n    return {i} * 1000\n\n" for i in range(8))
+    start = time.monotonic()
+    assert assistant.analyze_code(code, "py") == "merged"
+    assert len(calls) > 3
+    # All chunks overlap, so this is ~one chunk round trip plus the merge
+    assert time.monotonic() - start < 0.2 * (len(calls) - 1)
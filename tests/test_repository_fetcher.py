@@ -0,0 +1,127 @@
+import io
+import tarfile
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+
+from app import HTTPClient, RepositoryFetcher, git_blob_sha
+
+FILES = {
+    "src/app.py": b"print('app')\n",
+    "src/util.js": b"export const x = 1;\n",
+    "vendor/lib.py": b"print('vendored')\n",
+    "logo.png": b"\x89PNG not really",
+    "data.txt": b"binary\0content",
+    "big.py": b"x = 1\n" * 100,
+}
+
+
+def make_tarball(files, prefix="owner-repo-c0ffee", symlinks=()):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for path, data in files.items():
+            info = tarfile.TarInfo(f"{prefix}/{path}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        for path, target in symlinks:
+            info = tarfile.TarInfo(f"{prefix}/{path}")
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            archive.addfile(info)
+    return buffer.getvalue()
+
+
+class TarballHandler(BaseHTTPRequestHandler):
+    body = b""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-gzip")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def fake_repo(url, tree, truncated=False):
+    elements = [
+        SimpleNamespace(path=path, sha=sha, size=size, type="blob", mode=mode)
+        for path, sha, size, mode in tree
+    ]
+    return SimpleNamespace(
+        full_name="owner/repo",
+        get_git_tree=lambda ref, recursive: SimpleNamespace(tree=elements, raw_data={"truncated": truncated}),
+        get_archive_link=lambda kind, ref: f"{url}/archive"
+    )
+
+
+def blobs(files, mode="100644"):
+    return [(path, git_blob_sha(data), len(data), mode) for path, data in files.items()]
+
+
+@pytest.fixture
+def url(serve):
+    TarballHandler.body = make_tarball(FILES, symlinks=[("link.py", "src/app.py")])
+    return serve(TarballHandler)
+
+
+@pytest.fixture
+def fetcher(url):
+    return RepositoryFetcher(HTTPClient(url, max_retries=0), max_file_size=500)
+
+
+def test_is_wanted_applies_size_vendored_binary_and_glob_filters():
+    fetcher = RepositoryFetcher(None, include=["src/*", "*.md"], exclude=["src/generated/*"], max_file_size=100)
+    assert fetcher.is_wanted("src/app.py", 10)
+    assert fetcher.is_wanted("README.md")
+    assert not fetcher.is_wanted("src/app.py", 101)
+    assert not fetcher.is_wanted("src/node_modules/x.js")
+    assert not fetcher.is_wanted("src/icon.PNG")
+    assert not fetcher.is_wanted("tools/build.py")
+    assert not fetcher.is_wanted("src/generated/api.py")
+
+
+def test_list_tree_skips_filtered_paths_and_symlinks(fetcher, url):
+    tree = blobs(FILES) + [("link.py", "1" * 40, 10, RepositoryFetcher.SYMLINK_MODE)]
+    wanted, truncated = fetcher.list_tree(fake_repo(url, tree), "main")
+    assert not truncated
+    assert sorted(wanted) == ["data.txt", "src/app.py", "src/util.js"]
+    assert wanted["src/app.py"] == git_blob_sha(FILES["src/app.py"])
+
+
+def test_download_strips_the_archive_prefix_and_keeps_only_wanted_blobs(fetcher, url):
+    repo = fake_repo(url, blobs(FILES))
+    wanted, _ = fetcher.list_tree(repo, "main")
+    files = fetcher.download(repo, "main", dict(wanted))
+    assert [(f.path, f.sha, f.decoded_content) for f in files] == [
+        ("src/app.py", wanted["src/app.py"], FILES["src/app.py"]),
+        ("src/util.js", wanted["src/util.js"], FILES["src/util.js"]),
+    ]
+
+
+def test_binary_blobs_are_dropped_from_wanted_and_not_listed_again(fetcher, url):
+    repo = fake_repo(url, blobs(FILES))
+    wanted, _ = fetcher.list_tree(repo, "main")
+    fetcher.download(repo, "main", wanted)
+    assert "data.txt" not in wanted
+    assert "data.txt" not in fetcher.list_tree(repo, "next")[0]
+
+
+def test_truncated_tree_selects_every_analyzable_file_from_the_tarball(fetcher, url):
+    repo = fake_repo(url, [], truncated=True)
+    wanted, truncated = fetcher.list_tree(repo, "main")
+    assert wanted == {} and truncated
+    files = fetcher.download(repo, "main", wanted, truncated)
+    assert [(f.path, f.sha) for f in files] == [
+        ("src/app.py", git_blob_sha(FILES["src/app.py"])),
+        ("src/util.js", git_blob_sha(FILES["src/util.js"])),
+    ]
+
+
+def test_nothing_to_download_skips_the_tarball(fetcher, url):
+    repo = fake_repo(url, [])
+    repo.get_archive_link = None
+    assert fetcher.download(repo, "main", {}) == []
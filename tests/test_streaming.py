@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+class StubAssistant:
+    """Stands in for GitHubAssistant with one reused and two freshly analyzed files"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.saved = None
+
+    def get_repo(self, repo_name):
+        return SimpleNamespace(full_name=repo_name)
+
+    def get_repository_summary(self, repo):
+        stats = {"stars": 1, "forks": 2, "issues": 3, "created": "2024-01-01", "last_update": "2024-02-01"}
+        return {"name": "repo", "description": None, "stats": stats, "files": []}
+
+    def plan_analysis(self, repo):
+        return {
+            "commit": "c2" * 20,
+            "previous_commit": "c1" * 20,
+            "reused": {"a.py": {"name": "a.py", "type": "py", "content": "a", "analysis": "old"}},
+            "blob_shas": {},
+            "files": ["b.py", "c.py"],
+            "deleted": []
+        }
+
+    def iter_file_analyses(self, repo, files):
+        for index, name in enumerate(files):
+            if index == self.fail_after:
+                raise RuntimeError("LLM unavailable")
+            yield index, {"name": name, "type": "py", "content": name, "analysis": "new"}
+
+    def save_analysis(self, repo, plan, analyzed):
+        self.saved = analyzed
+
+
+def stream(monkeypatch, assistant):
+    monkeypatch.setattr(app, "assistant", assistant)
+    response = app.app.test_client().post(
+        "/chat", json={"message": "analyze repository owner/repo", "stream": True}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_events_arrive_in_order(monkeypatch):
+    assistant = StubAssistant()
+    events = stream(monkeypatch, assistant)
+    assert [event["type"] for event in events] == ["header", "status", "file", "file", "file", "done"]
+    assert events[0]["response"].startswith("Analysis of repo:")
+    assert events[1]["analyzed"] == 2 and events[1]["skipped"] == 1
+    assert events[2]["name"] == "a.py" and events[2]["cached"]
+    assert [event["index"] for event in events[3:5]] == [0, 1]
+    assert events[-1]["files"] == 3
+    assert [file["name"] for file in assistant.saved] == ["b.py", "c.py"]
+
+
+@pytest.mark.parametrize("fail_after", [0, 1])
+def test_failures_end_the_stream_with_an_error_event(monkeypatch, fail_after):
+    assistant = StubAssistant(fail_after=fail_after)
+    events = stream(monkeypatch, assistant)
+    assert events[-1] == {"type": "error", "error": "LLM unavailable"}
+    assert [event["type"] for event in events[:-1]] == ["header", "status"] + ["file"] * (1 + fail_after)
+    assert assistant.saved is None